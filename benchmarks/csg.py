@@ -0,0 +1,100 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import argparse
+import time
+
+from raytrace import *
+
+
+class Counter:
+    
+    # counts the rays and points passed to the sphere tests
+    
+    def __init__(self):
+        self.rays = 0
+        self.points = 0
+        self.methods = {name: getattr(Sphere, name) for name in ['hits', 'distances', 'interior']}
+    
+    def __enter__(self):
+        counter = self
+        hits, distances, interior = [self.methods[name] for name in ['hits', 'distances', 'interior']]
+        
+        def countedHits(sphere, ray, invert = False):
+            counter.rays += len(ray)
+            return hits(sphere, ray, invert)
+        
+        def countedDistances(sphere, ray, invert = False):
+            counter.rays += len(ray)
+            return distances(sphere, ray, invert)
+        
+        def countedInterior(sphere, point):
+            counter.points += len(point)
+            return interior(sphere, point)
+        
+        Sphere.hits = countedHits
+        Sphere.distances = countedDistances
+        Sphere.interior = countedInterior
+        return self
+    
+    def __exit__(self, *args):
+        for name, method in self.methods.items():
+            setattr(Sphere, name, method)
+
+
+def csgTree(rng, depth):
+    # random operations over spheres spread out far enough that many
+    # intersections are empty and many negatives miss their positive
+    if depth == 0:
+        return Sphere(V3(*rng.uniform([6, -3, -2], [12, 3, 2])), rng.uniform(0.5, 1.5), material = 'solid')
+    operation = rng.choice(['union', 'union', 'intersection', 'difference'])
+    fst = csgTree(rng, depth - 1)
+    snd = csgTree(rng, depth - 1)
+    if operation == 'union':
+        return Union(fst, snd)
+    if operation == 'intersection':
+        return Intersection(fst, snd)
+    return Difference(fst, snd)
+
+
+def exampleScene(depth, trees, seed = 0):
+    rng = np.random.default_rng(seed)
+    return {
+        'objects': [csgTree(rng, depth) for i in range(trees)] + [
+            Ground(V3(0, 0, -3), V3(0, 0, 1), material = 'floor')
+        ],
+        'materials': {
+            'solid': UniformMaterial(V3(0.9, 0.4, 0.2), reflectivity = 0.2),
+            'floor': UniformMaterial(V3(0.8, 0.8, 0.8))
+        },
+        'lighting': [
+            AmbientLight(0.2),
+            DirectionalLight(V3(1, 1, -1), 0.8)
+        ]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Primitive tests and render time of deep CSG trees.')
+    parser.add_argument('--depth', type = int, nargs = '+', default = [4, 6, 8])
+    parser.add_argument('--trees', type = int, default = 4)
+    parser.add_argument('--resolution', type = int, nargs = 2, default = [160, 120])
+    args = parser.parse_args()
+    
+    camera = CameraPerspective(V3(0, 0, 0.5), V3(1, 0, 0), (1.5, 1.125), tuple(args.resolution))
+    
+    print('%-6s %-10s %12s %12s %10s' % ('depth', 'optimize', 'ray tests', 'point tests', 'seconds'))
+    for depth in args.depth:
+        scene = exampleScene(depth, args.trees)
+        for optimize in [False, True]:
+            compiled = Scene(scene['objects'], scene['materials'], scene['lighting'], optimize = optimize)
+            with Counter() as counter:
+                start = time.perf_counter()
+                render(camera, compiled)
+                elapsed = time.perf_counter() - start
+            print('%-6d %-10s %12d %12d %10.3f' % (depth, optimize, counter.rays, counter.points, elapsed))
+
+
+if __name__ == '__main__':
+    main()
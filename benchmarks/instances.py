@@ -0,0 +1,80 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import argparse
+import time
+import tracemalloc
+
+from raytrace import *
+
+
+def part():
+    # a small CSG part shared by all copies
+    return Difference(
+        Intersection(
+            Sphere(V3(0, 0, 0), 1, material = 'metal'),
+            Sphere(V3(0.5, 0, 0), 1, material = 'metal')
+        ),
+        Sphere(V3(0.25, 0, 0.6), 0.4, material = 'paint')
+    )
+
+
+def placements(copies, seed = 0):
+    rng = np.random.default_rng(seed)
+    for i in range(copies):
+        yield (
+            V3(*rng.uniform([10, -40, -20], [100, 40, 20])),
+            V3(*rng.normal(size = 3)),
+            rng.uniform(0, 2 * np.pi)
+        )
+
+
+def nodeScene(copies):
+    prototype = part()
+    return [
+        Translation(offset, Rotation(axis, angle, prototype))
+        for offset, axis, angle in placements(copies)
+    ]
+
+
+def instancedScene(copies):
+    transforms = [
+        AffineTransform(TranslationHelper(offset).toMatrix() @ axisRotation(axis, angle).toMatrix())
+        for offset, axis, angle in placements(copies)
+    ]
+    return [Instances(part(), transforms)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Instances against one transformation node per copy.')
+    parser.add_argument('--copies', type = int, nargs = '+', default = [1000, 10000])
+    parser.add_argument('--resolution', type = int, nargs = 2, default = [200, 150])
+    args = parser.parse_args()
+    
+    camera = CameraPerspective(V3(0, 0, 0), V3(1, 0, 0), (1.2, 0.9), tuple(args.resolution))
+    materials = {
+        'metal': UniformMaterial(V3(0.7, 0.7, 0.8)),
+        'paint': UniformMaterial(V3(0.9, 0.2, 0.1))
+    }
+    lighting = [AmbientLight(0.2), DirectionalLight(V3(1, 1, -1), 0.8)]
+    
+    print('%-8s %-12s %12s %10s %10s' % ('copies', 'scene', 'memory MB', 'compile', 'render'))
+    for copies in args.copies:
+        for name, build in [('nodes', nodeScene), ('instances', instancedScene)]:
+            tracemalloc.start()
+            objects = build(copies)
+            start = time.perf_counter()
+            scene = Scene(objects, materials, lighting)
+            compiled = time.perf_counter() - start
+            memory = tracemalloc.get_traced_memory()[1] / 1e6
+            tracemalloc.stop()
+            
+            start = time.perf_counter()
+            render(camera, scene)
+            elapsed = time.perf_counter() - start
+            print('%-8d %-12s %12.1f %10.3f %10.3f' % (copies, name, memory, compiled, elapsed))
+
+
+if __name__ == '__main__':
+    main()
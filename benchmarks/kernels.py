@@ -0,0 +1,43 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import argparse
+
+from raytrace import *
+from timing import best
+
+
+def primitives():
+    return [
+        ('sphere', Sphere(V3(0, 0, 0), 1.5)),
+        ('ground', Ground(V3(0, 0, -1), V3(0.1, 0.2, 1)))
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Rays per second of the primitive intersection kernels.')
+    parser.add_argument('--rays', type = int, default = 1000000)
+    parser.add_argument('--repeat', type = int, default = 5)
+    args = parser.parse_args()
+    
+    rng = np.random.default_rng(0)
+    ray = Ray(
+        V3(*rng.uniform(-3, 3, (3, args.rays))),
+        V3(*rng.normal(size = (3, args.rays)))
+    )
+    
+    print('%-8s %-10s %-10s %14s' % ('backend', 'primitive', 'query', 'rays/sec'))
+    for backend in kernelBackends():
+        with kernelBackend(backend):
+            for name, primitive in primitives():
+                # the first call compiles the numba kernels
+                primitive.hits(ray)
+                primitive.distances(ray)
+                for query, f in [('hits', primitive.hits), ('distances', primitive.distances)]:
+                    elapsed = best(lambda: f(ray), args.repeat)
+                    print('%-8s %-10s %-10s %14.0f' % (backend, name, query, args.rays / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import argparse
+
+from raytrace import *
+from parallel import exampleScene
+from timing import best
+
+
+def operations(n):
+    rng = np.random.default_rng(0)
+    a = V3(*rng.normal(size = (3, n)))
+    b = V3(*rng.normal(size = (3, n)))
+    mask = rng.random(n) < 0.5
+    subset = b.extract(mask)
+    return [
+        ('add', lambda: a + b),
+        ('dot', lambda: a.dot(b)),
+        ('cross', lambda: a.cross(b)),
+        ('unit', lambda: a.unit()),
+        ('extract', lambda: a.extract(mask)),
+        ('place', lambda: a.place(mask, subset)),
+        ('where', lambda: a.where(mask, b))
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Planar versus packed V3 storage.')
+    parser.add_argument('--resolution', type = int, default = 400)
+    parser.add_argument('--size', type = int, default = 1000000)
+    parser.add_argument('--repeat', type = int, default = 3)
+    args = parser.parse_args()
+    
+    origin = V3(0, -3, 0.5)
+    direction = (V3(4, 0, 0) - origin).unit()
+    resolution = (args.resolution, args.resolution)
+    
+    results = {}
+    for name in ['planar', 'packed']:
+        with layout(name):
+            camera = CameraPerspective(origin, direction, (1, 1), resolution)
+            scene = exampleScene()
+            timings = [(op, best(f, args.repeat)) for op, f in operations(args.size)]
+            timings.append(('render', best(lambda: render(camera, scene), args.repeat)))
+            results[name] = timings
+    
+    print('%-10s %10s %10s %8s' % ('operation', 'planar', 'packed', 'ratio'))
+    for (op, planar), (op, packed) in zip(results['planar'], results['packed']):
+        print('%-10s %9.4fs %9.4fs %8.2f' % (op, planar, packed, planar / packed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import argparse
+import time
+
+from raytrace import *
+
+
+def exampleScene():
+    return {
+        'objects': [
+            Difference(
+                Intersection(
+                    Sphere(V3(4, 0, 0), 1),
+                    Sphere(V3(4, -1, 0), 1),
+                    material = 'blue'
+                ),
+                Sphere(V3(4, -1, 0), 0.5, material = 'green')
+            ),
+            Sphere(V3(4, 3, 0.8), 0.5, material = 'mirror'),
+            Ground(V3(0, 0, -20), V3(0, 0, 1), material = 'checkered')
+        ],
+        'materials': {
+            'green': UniformMaterial(V3(0, 1, 0)),
+            'blue': UniformMaterial(V3(0, 0, 1)),
+            'checkered': CheckeredMaterial(
+                UniformMaterial(V3(0.8, 0.8, 0.8)),
+                UniformMaterial(V3(0, 0, 0)),
+                scale = 10.0
+            ),
+            'mirror': UniformMaterial(V3(0, 0, 0), reflectivity = 1.0)
+        },
+        'lighting': [
+            AmbientLight(0.0),
+            DirectionalLight(V3(1, 1, -1))
+        ]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Frames per second of render() versus worker count.')
+    parser.add_argument('--resolution', type = int, default = 512)
+    parser.add_argument('--tile-size', type = int, default = 64)
+    parser.add_argument('--frames', type = int, default = 3)
+    parser.add_argument('--max-workers', type = int, default = os.cpu_count())
+    args = parser.parse_args()
+    
+    origin = V3(0, -3, 0.5)
+    camera = CameraPerspective(
+        origin,
+        (V3(4, 0, 0) - origin).unit(),
+        (1, 1),
+        (args.resolution, args.resolution)
+    )
+    scene = exampleScene()
+    
+    counts = [1]
+    while counts[-1] * 2 <= args.max_workers:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != args.max_workers:
+        counts.append(args.max_workers)
+    
+    print('workers  frames/sec  speedup')
+    baseline = None
+    for workers in counts:
+        start = time.perf_counter()
+        for frame in range(args.frames):
+            render(camera, scene, tile_size = args.tile_size, workers = workers)
+        fps = args.frames / (time.perf_counter() - start)
+        baseline = baseline or fps
+        print('%7d  %10.3f  %7.2f' % (workers, fps, fps / baseline))
+
+
+if __name__ == '__main__':
+    main()
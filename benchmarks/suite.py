@@ -0,0 +1,231 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import argparse
+import json
+import platform
+import time
+import tracemalloc
+
+from raytrace import *
+
+import csg
+import parallel
+from timing import best
+
+
+class RayCounter:
+    
+    # counts the rays traced against the scene hierarchy, camera and bounce
+    # rays go through collide and shadow rays through occlude
+    
+    def __init__(self, scene):
+        self.bvh = scene.bvh
+        self.rays = 0
+        self.shadow_rays = 0
+    
+    def __enter__(self):
+        counter = self
+        collide, occlude = self.bvh.collide, self.bvh.occlude
+        
+        def countedCollide(ray, nearest, invert = False):
+            counter.rays += len(ray)
+            return collide(ray, nearest, invert)
+        
+        def countedOcclude(ray, tmax, blocked):
+            counter.shadow_rays += len(ray)
+            return occlude(ray, tmax, blocked)
+        
+        self.bvh.collide = countedCollide
+        self.bvh.occlude = countedOcclude
+        return self
+    
+    def __exit__(self, *args):
+        del self.bvh.collide
+        del self.bvh.occlude
+
+
+def exampleSweep(value):
+    # the scene of example.py, seen from its camera
+    origin = V3(0, -3, 0.5)
+    camera = (origin, (V3(4, 0, 0) - origin).unit(), (1, 1))
+    return camera, parallel.exampleScene()
+
+
+def sphereField(count, lights = 1, seed = 0):
+    rng = np.random.default_rng(seed)
+    side = int(np.ceil(np.sqrt(count)))
+    objects = [
+        Sphere(
+            V3(4 + 2 * (i // side), 2 * (i % side) - side, rng.uniform(-0.5, 0.5)),
+            rng.uniform(0.3, 0.9),
+            material = 'sphere%d' % (i % 3)
+        )
+        for i in range(count)
+    ]
+    objects.append(Ground(V3(0, 0, -1), V3(0, 0, 1), material = 'checkered'))
+    materials = {
+        'sphere0': UniformMaterial(V3(0.9, 0.2, 0.1)),
+        'sphere1': UniformMaterial(V3(0.1, 0.6, 0.9), reflectivity = 0.3),
+        'sphere2': UniformMaterial(V3(0.8, 0.8, 0.2)),
+        'checkered': CheckeredMaterial(
+            UniformMaterial(V3(0.8, 0.8, 0.8)),
+            UniformMaterial(V3(0.1, 0.1, 0.1))
+        )
+    }
+    lighting = [AmbientLight(0.1)] + [
+        PointLight(V3(*rng.uniform([0, -side, 4], [2 * side, side, 8])), 1.0 / lights)
+        for i in range(lights)
+    ]
+    camera = (V3(-2, 0, 3), V3(1, 0, -0.3).unit(), (1.2, 0.9))
+    return camera, {'objects': objects, 'materials': materials, 'lighting': lighting}
+
+
+def fieldScene(value):
+    return sphereField(value)
+
+
+def lightsScene(value):
+    return sphereField(100, lights = value)
+
+
+def csgScene(value):
+    camera = (V3(0, 0, 0.5), V3(1, 0, 0), (1.5, 1.125))
+    return camera, csg.exampleScene(value, 4)
+
+
+def mirrorScene(value):
+    # two facing mirrors with spheres between them, most camera rays keep
+    # bouncing between the mirrors until the depth is exhausted, the normals
+    # are tilted off the y axis which the ground texture coordinates start from
+    objects = [
+        Ground(V3(0, -2, 0), V3(0.01, 1, 0), material = 'mirror'),
+        Ground(V3(0, 2, 0), V3(0.01, -1, 0), material = 'mirror'),
+        Ground(V3(0, 0, -1), V3(0, 0, 1), material = 'floor')
+    ] + [
+        Sphere(V3(3 + 2 * i, 0.8 * (-1) ** i, 0), 0.5, material = 'ball')
+        for i in range(4)
+    ]
+    materials = {
+        'mirror': UniformMaterial(V3(0.9, 0.9, 1.0), reflectivity = 0.9),
+        'floor': UniformMaterial(V3(0.6, 0.6, 0.6), reflectivity = 0.1),
+        'ball': UniformMaterial(V3(0.9, 0.3, 0.1), reflectivity = 0.5)
+    }
+    lighting = [AmbientLight(0.2), DirectionalLight(V3(1, 0.5, -1), 0.8)]
+    camera = (V3(0, 0, 0.5), V3(1, 0.6, -0.1).unit(), (1.2, 0.9))
+    return camera, {'objects': objects, 'materials': materials, 'lighting': lighting}
+
+
+# scene, swept parameter, values and the fixed settings of the other parameters
+SWEEPS = [
+    ('example', exampleSweep, 'resolution', [64, 128, 256]),
+    ('field', fieldScene, 'objects', [10, 100, 1000]),
+    ('lights', lightsScene, 'lights', [1, 4, 16]),
+    ('csg', csgScene, 'depth', [4, 6, 8]),
+    ('mirrors', mirrorScene, 'bounce', [0, 1, 2, 4, 8])
+]
+
+
+def measure(build, parameter, value, resolution, bounce, repeat):
+    if parameter == 'resolution':
+        resolution = value
+    if parameter == 'bounce':
+        bounce = value
+    (origin, direction, dimensions), scene = build(value)
+    camera = CameraPerspective(origin, direction, dimensions, (resolution, resolution))
+    
+    start = time.perf_counter()
+    compiled = Scene(scene['objects'], scene['materials'], scene['lighting'])
+    compile_time = time.perf_counter() - start
+    
+    with RayCounter(compiled) as counter:
+        render(camera, compiled, bounce)
+    
+    # peak memory is traced in a run of its own, tracing slows rendering down
+    tracemalloc.start()
+    render(camera, compiled, bounce)
+    memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    
+    seconds = best(lambda: render(camera, compiled, bounce), repeat)
+    rays = counter.rays + counter.shadow_rays
+    return {
+        'resolution': resolution,
+        'bounce': bounce,
+        'pixels': resolution * resolution,
+        'compile': compile_time,
+        'seconds': seconds,
+        'rays': counter.rays,
+        'shadow_rays': counter.shadow_rays,
+        'rays_per_second': rays / seconds,
+        'peak_memory': memory
+    }
+
+
+def compare(results, baseline):
+    # wall time of the baseline run over this run, above 1 is a speedup
+    previous = {(r['scene'], r['parameter'], r['value']): r for r in baseline['results']}
+    print()
+    print('%-10s %-12s %8s %10s %10s %8s %8s' % ('scene', 'parameter', 'value', 'before', 'after', 'speedup', 'memory'))
+    for result in results:
+        old = previous.get((result['scene'], result['parameter'], result['value']))
+        if old is None:
+            continue
+        print('%-10s %-12s %8d %10.3f %10.3f %8.2f %8.2f' % (
+            result['scene'], result['parameter'], result['value'],
+            old['seconds'], result['seconds'],
+            old['seconds'] / result['seconds'],
+            result['peak_memory'] / max(old['peak_memory'], 1)
+        ))
+
+
+def main():
+    names = [name for name, build, parameter, values in SWEEPS]
+    parser = argparse.ArgumentParser(description = 'Rays per second, wall time and peak memory of render() on standard scenes.')
+    parser.add_argument('--scenes', nargs = '+', choices = names, default = names)
+    parser.add_argument('--resolution', type = int, default = 128)
+    parser.add_argument('--bounce', type = int, default = 4)
+    parser.add_argument('--repeat', type = int, default = 3)
+    parser.add_argument('--quick', action = 'store_true', help = 'only the smallest two values of every sweep')
+    parser.add_argument('--output', help = 'write the results as JSON')
+    parser.add_argument('--compare', help = 'JSON results of an earlier run')
+    args = parser.parse_args()
+    
+    results = []
+    print('%-10s %-12s %8s %10s %10s %12s %12s %10s' % (
+        'scene', 'parameter', 'value', 'compile', 'render', 'rays', 'rays/s', 'memory MB'
+    ))
+    for name, build, parameter, values in SWEEPS:
+        if name not in args.scenes:
+            continue
+        for value in values[:2] if args.quick else values:
+            result = {'scene': name, 'parameter': parameter, 'value': value}
+            result.update(measure(build, parameter, value, args.resolution, args.bounce, args.repeat))
+            results.append(result)
+            print('%-10s %-12s %8d %10.3f %10.3f %12d %12.0f %10.1f' % (
+                name, parameter, value, result['compile'], result['seconds'],
+                result['rays'] + result['shadow_rays'], result['rays_per_second'], result['peak_memory'] / 1e6
+            ))
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'machine': platform.machine(),
+                'processor': platform.processor(),
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'resolution': args.resolution,
+                'bounce': args.bounce,
+                'repeat': args.repeat,
+                'results': results
+            }, f, indent = 2)
+    
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,11 @@
+import time
+
+
+def best(f, repeat):
+    # the fastest of repeated calls, the least disturbed by other processes
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        f()
+        times.append(time.perf_counter() - start)
+    return min(times)
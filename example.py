@@ -1,6 +1,4 @@
 from raytrace import *
-from PIL import Image
-import numpy as np
 
 
 resolution = (1000, 1000)
@@ -43,11 +41,6 @@ scene = {
     ]
 }
 
-raster = render(camera, scene) * 255
-
-rgb = [
-    Image.fromarray(raster.x.reshape(resolution).astype(np.uint8), "L"),
-    Image.fromarray(raster.y.reshape(resolution).astype(np.uint8), "L"),
-    Image.fromarray(raster.z.reshape(resolution).astype(np.uint8), "L")
-]
-Image.merge("RGB", rgb).save("example.png")
+# tiles are written to the image as they finish, the raster is never held
+with PngSink("example.png", resolution) as sink:
+    render(camera, scene, tile_size = 100, sink = sink)
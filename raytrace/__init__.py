@@ -3,6 +3,13 @@ import numpy as np
 from .vector import *
 from .camera import *
 from .geometry import *
+from .bounds import *
+from .bvh import *
+from .kernels import *
+from .scene import *
+from .tree import *
+from .profiling import *
+from .output import *
 from .lighting import *
 from .material import *
 from .render import *
@@ -0,0 +1,117 @@
+import numpy as np
+
+from .vector import *
+
+
+class AABB:
+    
+    def __init__(self, lo, hi):
+        self.lo = lo
+        self.hi = hi
+    
+    def isEmpty(self):
+        return bool(
+            (self.lo.x > self.hi.x).any()
+            or (self.lo.y > self.hi.y).any()
+            or (self.lo.z > self.hi.z).any()
+        )
+    
+    def isFinite(self):
+        return bool(
+            np.isfinite(self.lo.x).all() and np.isfinite(self.hi.x).all()
+            and np.isfinite(self.lo.y).all() and np.isfinite(self.hi.y).all()
+            and np.isfinite(self.lo.z).all() and np.isfinite(self.hi.z).all()
+        )
+    
+    def center(self):
+        return (self.lo + self.hi) * 0.5
+    
+    def union(self, other):
+        if self.isEmpty():
+            return other
+        if other.isEmpty():
+            return self
+        return AABB(
+            V3(
+                np.minimum(self.lo.x, other.lo.x),
+                np.minimum(self.lo.y, other.lo.y),
+                np.minimum(self.lo.z, other.lo.z)
+            ),
+            V3(
+                np.maximum(self.hi.x, other.hi.x),
+                np.maximum(self.hi.y, other.hi.y),
+                np.maximum(self.hi.z, other.hi.z)
+            )
+        )
+    
+    def intersection(self, other):
+        return AABB(
+            V3(
+                np.maximum(self.lo.x, other.lo.x),
+                np.maximum(self.lo.y, other.lo.y),
+                np.maximum(self.lo.z, other.lo.z)
+            ),
+            V3(
+                np.minimum(self.hi.x, other.hi.x),
+                np.minimum(self.hi.y, other.hi.y),
+                np.minimum(self.hi.z, other.hi.z)
+            )
+        )
+    
+    def corners(self):
+        return V3(
+            np.array([self.lo.x[0], self.hi.x[0]]).repeat(4),
+            np.tile(np.array([self.lo.y[0], self.hi.y[0]]).repeat(2), 2),
+            np.tile(np.array([self.lo.z[0], self.hi.z[0]]), 4)
+        )
+    
+    def transform(self, transform):
+        if self.isEmpty():
+            return self
+        if not self.isFinite():
+            return unboundedBox()
+        corners = transform.apply(self.corners())
+        return AABB(
+            V3(corners.x.min(), corners.y.min(), corners.z.min()),
+            V3(corners.x.max(), corners.y.max(), corners.z.max())
+        )
+    
+    def slabs(self, ray):
+        # entry and exit distances of every ray, clamped to the forward half
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            tnear = np.zeros(len(ray), dtype = getPrecision())
+            tfar = np.full(len(ray), np.inf, dtype = getPrecision())
+            for lo, hi, r, v in [
+                (self.lo.x, self.hi.x, ray.r.x, ray.v.x),
+                (self.lo.y, self.hi.y, ray.r.y, ray.v.y),
+                (self.lo.z, self.hi.z, ray.r.z, ray.v.z)
+            ]:
+                inv = 1.0 / v
+                t1 = (lo - r) * inv
+                t2 = (hi - r) * inv
+                # fmin and fmax skip the nans of rays lying in a slab plane
+                tnear = np.fmax(tnear, np.fmin(t1, t2))
+                tfar = np.fmin(tfar, np.fmax(t1, t2))
+        return tnear, tfar
+    
+    def hit(self, ray):
+        tnear, tfar = self.slabs(ray)
+        return tnear <= tfar
+
+    def contains(self, point):
+        inside = np.ones(len(point), dtype = bool)
+        for lo, hi, p in [
+            (self.lo.x, self.hi.x, point.x),
+            (self.lo.y, self.hi.y, point.y),
+            (self.lo.z, self.hi.z, point.z)
+        ]:
+            inside &= (lo <= p) & (p <= hi)
+        return inside
+
+
+def unboundedBox():
+    return AABB(V3(-np.inf, -np.inf, -np.inf), V3(np.inf, np.inf, np.inf))
+
+
+def emptyBox():
+    return AABB(V3(np.inf, np.inf, np.inf), V3(-np.inf, -np.inf, -np.inf))
@@ -0,0 +1,158 @@
+import numpy as np
+
+from .vector import *
+from .bounds import *
+
+
+class BVHNode:
+    
+    def __init__(self, box, children = (), objects = ()):
+        self.box = box
+        self.children = children
+        self.objects = objects
+
+
+class BVH:
+    
+    def __init__(self, objects, leaf_size = 2):
+        self.objects = list(objects)
+        self.leaf_size = leaf_size
+        
+        boxes = [obj.bounds() for obj in self.objects]
+        
+        # unbounded objects such as ground planes are tested against every ray,
+        # objects with empty boxes can never be hit and are dropped
+        self.unbounded = [obj for obj, box in zip(self.objects, boxes) if not box.isFinite()]
+        bounded = [
+            (obj, box) for obj, box in zip(self.objects, boxes)
+            if box.isFinite() and not box.isEmpty()
+        ]
+        
+        # the boxes are kept as (n, 3) arrays of corners while building
+        self.entries = [obj for obj, box in bounded]
+        self.lo = np.array([[box.lo.x[0], box.lo.y[0], box.lo.z[0]] for obj, box in bounded]).reshape(-1, 3)
+        self.hi = np.array([[box.hi.x[0], box.hi.y[0], box.hi.z[0]] for obj, box in bounded]).reshape(-1, 3)
+        
+        self.root = self.build(np.arange(len(bounded))) if bounded else None
+    
+    def build(self, items):
+        lo = self.lo[items].min(axis = 0)
+        hi = self.hi[items].max(axis = 0)
+        box = AABB(V3(lo[0], lo[1], lo[2]), V3(hi[0], hi[1], hi[2]))
+        
+        if len(items) <= self.leaf_size:
+            return BVHNode(box, objects = [self.entries[i] for i in items])
+        
+        # split at the median centroid along the axis of largest centroid spread
+        centers = (self.lo[items] + self.hi[items]) * 0.5
+        axis = np.argmax(centers.max(axis = 0) - centers.min(axis = 0))
+        order = np.argsort(centers[:, axis], kind = 'stable')
+        half = len(items) // 2
+        
+        return BVHNode(box, children = (
+            self.build(items[order[:half]]),
+            self.build(items[order[half:]])
+        ))
+    
+    def collide(self, ray, nearest, invert = False):
+        for obj in self.unbounded:
+            obj.intersectInto(ray, nearest, invert = invert)
+        if self.root is not None:
+            self.traverse(self.root, ray, np.arange(len(ray)), nearest, invert)
+    
+    def traverse(self, node, ray, indices, nearest, invert = False):
+        # boxes entered beyond the nearest hit found so far are skipped
+        tnear, tfar = node.box.slabs(ray)
+        mask = np.logical_and(tnear <= tfar, tnear <= np.take(nearest.t, indices))
+        if not mask.any():
+            return
+        if not mask.all():
+            ray = ray.extract(mask)
+            indices = np.extract(mask, indices)
+        
+        for obj in node.objects:
+            obj.intersectInto(ray, nearest, indices, invert)
+        for child in node.children:
+            self.traverse(child, ray, indices, nearest, invert)
+    
+    def candidates(self, ray):
+        # the rays reaching the box of each object, as (object, ray indices)
+        # pairs, for objects that trace many rays at once
+        pairs = [(obj, np.arange(len(ray))) for obj in self.unbounded]
+        if self.root is not None:
+            self.traverseCandidates(self.root, ray, np.arange(len(ray)), pairs)
+        return pairs
+    
+    def traverseCandidates(self, node, ray, indices, pairs):
+        mask = node.box.hit(ray)
+        if not mask.any():
+            return
+        if not mask.all():
+            ray = ray.extract(mask)
+            indices = np.extract(mask, indices)
+        
+        for obj in node.objects:
+            if len(node.objects) > 1:
+                pairs.append((obj, np.extract(obj.bounds().hit(ray), indices)))
+            else:
+                pairs.append((obj, indices))
+        for child in node.children:
+            self.traverseCandidates(child, ray, indices, pairs)
+    
+    def occlude(self, ray, tmax, blocked):
+        for obj in self.unbounded:
+            active = np.flatnonzero(np.logical_not(blocked))
+            if len(active) == 0:
+                return
+            np.put(blocked, active, obj.occludes(ray.take(active), np.take(tmax, active)))
+        if self.root is not None:
+            self.traverseOcclusion(self.root, ray, np.arange(len(ray)), tmax, blocked)
+    
+    def traverseOcclusion(self, node, ray, indices, tmax, blocked):
+        # rays blocked anywhere else in the tree are dropped before each test
+        tnear, tfar = node.box.slabs(ray)
+        mask = np.logical_and(
+            np.logical_and(tnear <= tfar, tnear < np.take(tmax, indices)),
+            np.logical_not(np.take(blocked, indices))
+        )
+        if not mask.any():
+            return
+        if not mask.all():
+            ray = ray.extract(mask)
+            indices = np.extract(mask, indices)
+        
+        for obj in node.objects:
+            hit = obj.occludes(ray, np.take(tmax, indices))
+            if hit.any():
+                np.put(blocked, np.extract(hit, indices), True)
+                if hit.all():
+                    return
+                ray = ray.extract(np.logical_not(hit))
+                indices = np.extract(np.logical_not(hit), indices)
+        for child in node.children:
+            self.traverseOcclusion(child, ray, indices, tmax, blocked)
+    
+    def interior(self, point, exclude = None):
+        # whether the points are inside any of the objects but exclude, only
+        # objects whose boxes contain a point are asked about it
+        inside = np.zeros(len(point), dtype = bool)
+        for obj in self.unbounded:
+            if obj is not exclude:
+                np.logical_or(inside, obj.interior(point), out = inside)
+        if self.root is not None:
+            self.traverseInterior(self.root, point, np.arange(len(point)), inside, exclude)
+        return inside
+    
+    def traverseInterior(self, node, point, indices, inside, exclude):
+        mask = np.logical_and(node.box.contains(point), np.logical_not(np.take(inside, indices)))
+        if not mask.any():
+            return
+        if not mask.all():
+            point = point.extract(mask)
+            indices = np.extract(mask, indices)
+        
+        for obj in node.objects:
+            if obj is not exclude:
+                np.put(inside, np.extract(obj.interior(point), indices), True)
+        for child in node.children:
+            self.traverseInterior(child, point, indices, inside, exclude)
@@ -1,4 +1,39 @@
 from .vector import *
+from .profiling import *
+
+
+def tileWindows(resolution, tile_size):
+    if isinstance(tile_size, int):
+        tile_size = (tile_size, tile_size)
+    width = resolution[0]
+    height = resolution[1]
+    for top in range(0, height, tile_size[1]):
+        for left in range(0, width, tile_size[0]):
+            yield (
+                left,
+                top,
+                min(left + tile_size[0], width),
+                min(top + tile_size[1], height)
+            )
+
+
+def windowPixels(resolution, window):
+    left, top, right, bottom = window
+    cols = np.arange(left, right)
+    rows = np.arange(top, bottom)
+    return (rows[:, np.newaxis] * resolution[0] + cols[np.newaxis, :]).ravel()
+
+
+def pixelCenters(resolution, pixels = None):
+    width = resolution[0]
+    height = resolution[1]
+    if pixels is None:
+        pixels = np.arange(width * height)
+    
+    # pixel coordinates of the centers, measured from the upper left corner
+    px = (pixels % width + 0.5).astype(getPrecision())
+    py = (pixels // width + 0.5).astype(getPrecision())
+    return px, py
 
 
 class CameraPerspective:
@@ -12,11 +47,12 @@ class CameraPerspective:
     def area(self):
         return self.resolution[0] * self.resolution[1]
         
-    def rays(self):
-        width = self.resolution[0]
-        height = self.resolution[1]
-        area = width * height
+    @profiled('camera')
+    def rays(self, pixels = None):
+        return self.pixelRays(*pixelCenters(self.resolution, pixels))
         
+    @profiled('camera')
+    def pixelRays(self, px, py):
         # unit directions on screen
         right = self.direction.cross(V3(0, 0, 1)).unit()
         down =  self.direction.cross(right).unit()
@@ -30,24 +66,17 @@ class CameraPerspective:
                    + down.scale(-0.5 * self.dimensions[1])
                    + self.direction)
         
-        # displacements relative to upper left corner per pixel
-        us = du.scale(
-            np.tile(
-                np.arange(0.5, width  + 0.5, 1),
-                height
-            )
-        )
-        vs = dv.scale(
-            np.repeat(
-                np.arange(0.5, height + 0.5, 1),
-                width
-            )
-        )
+        # displacements relative to upper left corner per pixel, accumulated
+        # into a single buffer
+        directions = du.scale(px)
+        directions += upper_left
+        directions += dv.scale(py)
+        directions -= self.position
+        directions.unit(out = directions)
         
-        positions = self.position.repeat(area)
-        directions = (upper_left + us + vs - self.position).unit()
+        positions = self.position.repeat(len(px))
         
-        return Ray(positions, directions)
+        return Ray(positions, directions, normalize = False)
 
 
 class CameraOrthogonal:
@@ -61,11 +90,12 @@ class CameraOrthogonal:
     def area(self):
         return self.resolution[0] * self.resolution[1]
         
-    def rays(self):
-        width = self.resolution[0]
-        height = self.resolution[1]
-        area = width * height
+    @profiled('camera')
+    def rays(self, pixels = None):
+        return self.pixelRays(*pixelCenters(self.resolution, pixels))
         
+    @profiled('camera')
+    def pixelRays(self, px, py):
         # unit directions on screen
         right = self.direction.cross(V3(0, 0, 1)).unit()
         down =  self.direction.cross(right).unit()
@@ -79,25 +109,14 @@ class CameraOrthogonal:
                    + down.scale(-0.5 * self.dimensions[1]))
         
         # displacements relative to upper left corner per pixel
-        us = du.scale(
-            np.tile(
-                np.arange(0.5, width  + 0.5, 1),
-                height
-            )
-        )
-        vs = dv.scale(
-            np.repeat(
-                np.arange(0.5, height + 0.5, 1),
-                width
-            )
-        )
-        
-        positions = upper_left + us + vs
+        positions = du.scale(px)
+        positions += upper_left
+        positions += dv.scale(py)
         
         # all rays are parallel for an orthogonal camera
-        directions = self.direction.repeat(area)
+        directions = self.direction.repeat(len(px))
         
-        return Ray(positions, directions)
+        return Ray(positions, directions, normalize = False)
 
 
 class CameraPanoramic:
@@ -115,24 +134,19 @@ class CameraPanoramic:
     def area(self):
         return self.resolution[0] * self.resolution[1]
     
-    def rays(self):
-        width = self.resolution[0]
-        height = self.resolution[1]
-        area = width * height
-        
-        dlong = (self.long_max - self.long_min) / width
-        dlat = (self.lat_max - self.lat_min) / height
-        longs = np.tile(
-            np.linspace(self.long_max - 0.5 * dlong, self.long_min + 0.5 * dlong, width),
-            height
-        )
-        lats = np.repeat(
-            np.linspace(self.lat_max - 0.5 * dlat, self.lat_min + 0.5 * dlat, height),
-            width
-        )
+    @profiled('camera')
+    def rays(self, pixels = None):
+        return self.pixelRays(*pixelCenters(self.resolution, pixels))
+        
+    @profiled('camera')
+    def pixelRays(self, px, py):
+        dlong = (self.long_max - self.long_min) / self.resolution[0]
+        dlat = (self.lat_max - self.lat_min) / self.resolution[1]
+        longs = self.long_max - px * dlong
+        lats = self.lat_max - py * dlat
         
         return Ray(
-            self.pos.repeat(area),
+            self.pos.repeat(len(px)),
             V3(
                 np.cos(lats) * np.cos(longs),
                 np.cos(lats) * np.sin(longs),
@@ -145,9 +159,14 @@ class CameraPrecomputed:
     
     def __init__(self, precomputed_rays):
         self.precomputed_rays = precomputed_rays
+        self.resolution = (len(precomputed_rays), 1)
     
     def area(self):
         return len(self.precomputed_rays)
     
-    def rays(self):
-        return self.precomputed_rays
\ No newline at end of file
+    @profiled('camera')
+    def rays(self, pixels = None):
+        if pixels is None:
+            return self.precomputed_rays
+        else:
+            return self.precomputed_rays.take(pixels)
\ No newline at end of file
@@ -1,206 +1,535 @@
+import copy
 import numpy as np
 from .vector import *
+from .vector import _v3
+from .bounds import *
+from .bvh import *
+from .kernels import *
+from .transform import *
+from .tree import *
+from .profiling import *
 from .render import *
 
 
 class Geometry:
     def __init__(self, material=None):
-        if material is None:
-            self.material = 0
+        self.material = material
+        # small integer id of the material, resolved per scene by MaterialTable
+        self.matid = 0
+        self.box = None
+        self.weight = None
+    def setMatId(self, collisions):
+        if self.matid != 0:
+            collisions.setMatId(self.matid)
+    def children(self):
+        return ()
+    def setChildren(self, children):
+        pass
+    def withChildren(self, children):
+        # a copy of this node over other children, the node itself is unchanged
+        current = self.children()
+        if len(children) == len(current) and all(a is b for a, b in zip(children, current)):
+            return self
+        return self.duplicate(children)
+    def duplicate(self, children):
+        node = copy.copy(self)
+        node.setChildren(children)
+        node.prepare()
+        return node
+    def flattened(self):
+        # the same tree with chains of transformations fused into one
+        return rewrite(self, lambda node, children: node.flatten(children))
+    def flatten(self, children):
+        return self.withChildren(children)
+    def tracedCopy(self, copies = None):
+        # the flattened tree made of prepared copies only, trees copied with
+        # the same copies keep the subtrees they share shared
+        return _distributed(rewrite(self, lambda node, children: node.duplicate(children).flatten(children), copies))
+    def optimized(self):
+        # the same shape with a simpler tree, see the CSG nodes for the rules
+        return rewrite(self, lambda node, children: node.optimize(children))
+    def optimize(self, children):
+        return self.withChildren(children)
+    def cost(self):
+        # number of primitives below this node, the price of tracing it
+        if self.weight is None:
+            children = self.children()
+            self.weight = sum(child.cost() for child in children) if children else 1
+        return self.weight
+    def prepare(self):
+        # derived constants are recomputed when a scene is compiled
+        self.box = None
+        self.weight = None
+    def intersectInto(self, ray, nearest, indices = None, invert = False):
+        collisions = self.intersections(ray, invert)
+        if indices is None:
+            nearest.takeNearer(collisions)
         else:
-            self.material = hash(material)
-    def setMatHash(self, collisions):
-        if self.material != 0:
-            collisions.setMatHash(self.material)
+            nearest.takeNearerAt(indices, collisions)
+    def occludes(self, ray, tmax):
+        return self.intersections(ray).t < tmax
+    def bounds(self):
+        if self.box is None:
+            self.box = self.computeBounds()
+        return self.box
+    def computeBounds(self):
+        return unboundedBox()
 
 
-class Ground(Geometry):
+class Primitive(Geometry):
+    
+    def __init__(self, material=None):
+        super().__init__(material=material)
+    
+    def intersections(self, ray, invert = False):
+        mask, distance_set, incident_set, normal_set = self.hits(ray, invert)
+        
+        collisions = CollisionResult(len(ray))
+        collisions.place(mask, distance_set, incident_set, normal_set, (self, invert))
+        
+        self.setMatId(collisions)
+        
+        return collisions
+    
+    def intersectInto(self, ray, nearest, indices = None, invert = False):
+        # only the hit subset is written, no full-size result is allocated
+        mask, distance_set, incident_set, normal_set = self.hits(ray, invert)
+        if indices is None:
+            indices = np.flatnonzero(mask)
+        else:
+            indices = np.extract(mask, indices)
+        nearest.putNearer(indices, distance_set, incident_set, normal_set, self.matid, (self, invert))
+
+    def occludes(self, ray, tmax):
+        # any-hit query, normals and texture coordinates are never computed
+        mask, distance_set = self.distances(ray)
+        blocked = np.zeros(len(ray), dtype = bool)
+        np.place(blocked, mask, distance_set < np.extract(mask, tmax))
+        return blocked
+
+
+class Ground(Primitive):
     
     def __init__(self, position, normal, material=None):
         super().__init__(material=material)
         self.normal = normal.unit()
         self.position = self.normal * position.dot(self.normal)
+        self.prepare()
     
-    def intersections(self, ray, invert = False):
+    def prepare(self):
+        super().prepare()
+        self.offset = self.position.norm()
+        
+        # texture frame of the plane
+        if self.normal.allEqual(V3(1, 0, 0)):
+            self.udir = V3(0, 1, 0)
+            self.vdir = V3(0, 0, 1)
+        else:
+            self.udir = V3(0, 1, 0).cross(self.normal).unit()
+            self.vdir = self.normal.cross(self.udir)
+        
+        self.inverted = None
+    
+    def flipped(self):
+        # the complementary half space, used for inverted intersections
+        if self.inverted is None:
+            self.inverted = Ground(self.position, self.normal * -1)
+        return self.inverted
+    
+    @profiled('primitive', ray = 1, node = True)
+    def distances(self, ray, invert = False):
         if invert:
-            return Ground(self.position, self.normal * -1).intersections(ray)
+            return self.flipped().distances(ray)
         
         else:
-            area = len(ray)
-            
-            directions_para = self.normal.dot(ray.v) * -1
-            positions_para = self.normal.dot(ray.r) * -1
-            
-            mask = np.logical_and(
-                directions_para > 0,
-                (ray.r - self.position).dot(self.normal) > 0
-            )
-            
-            directions_para_set = np.extract(mask, directions_para)
-            positions_para_set = np.extract(mask, positions_para)
-            
-            distance_set = (self.position.norm() - positions_para_set) / directions_para_set
+            return groundKernel(ray.r, ray.v, self.position, self.normal, self.offset, shade = False)
+    
+    @profiled('primitive', ray = 1, node = True)
+    def hits(self, ray, invert = False):
+        if invert:
+            return self.flipped().hits(ray)
+        
+        else:
+            mask, distance_set, incident = groundKernel(ray.r, ray.v, self.position, self.normal, self.offset)
             normal_set = self.normal.repeat(len(distance_set))
             
-            if self.normal.allEqual(V3(1, 0, 0)):
-                udir = V3(0, 1, 0)
-                vdir = V3(0, 0, 1)
-            else:
-                udir = V3(0, 1, 0).cross(self.normal).unit()
-                vdir = self.normal.cross(udir)
-            
-            ray_set = ray.extract(mask)
-            incident_set = ray_set.trace(distance_set) - self.position
-            u_set = incident_set.dot(udir)
-            v_set = incident_set.dot(vdir)
-            
-            collisions = CollisionResult(area)
-            collisions.place(mask, incident_set + self.position, normal_set, u_set, v_set)
-            
-            self.setMatHash(collisions)
-            
-            return collisions
+            return mask, distance_set, _v3(*incident), normal_set
+    
+    def uv(self, points, invert = False):
+        if invert:
+            return self.flipped().uv(points)
+        
+        else:
+            local = points - self.position
+            return local.dot(self.udir), local.dot(self.vdir)
     
+    @profiled('interior', ray = 1, node = True)
     def interior(self, point):
         return (point - self.position).dot(self.normal) < 0
+    
+    def computeBounds(self):
+        # a half space extends to infinity in at least one direction
+        return unboundedBox()
 
 
-class Sphere(Geometry):
+class Sphere(Primitive):
     
     def __init__(self, center, radius, material=None):
         super().__init__(material=material)
         self.center = center
         self.radius = radius
         
-    def intersections(self, ray, invert = False):
-        area = len(ray)
-        
-        x = ray.r - self.center
-        x_para = ray.v.scale(x.dot(ray.v))
-        x_perp = x - x_para
-        
-        mask = np.logical_and(
-            np.logical_or(
-                x.normsq() > self.radius**2,
-                invert
-            ),
-            np.logical_and(
-                x_perp.normsq() <= self.radius**2,
-                x.dot(ray.v) < 0
-            )
-        )
-        
-        x_para_set = x_para.extract(mask)
-        x_perp_set = x_perp.extract(mask)
-        ray_set = ray.extract(mask)
-        
-        y_para_orientation = 1 if invert else -1
-        y_para_set = ray_set.v.scale(y_para_orientation * np.sqrt(self.radius ** 2 - x_perp_set.normsq()))
+    @profiled('primitive', ray = 1, node = True)
+    def distances(self, ray, invert = False):
+        return sphereKernel(ray.r, ray.v, self.center, self.radius, invert, shade = False)
         
-        distance_set = (x_para_set - y_para_set).norm()
-        incident_set = ray_set.trace(distance_set)
-        
-        normal_set = (x_perp_set + y_para_set).unit()
+    @profiled('primitive', ray = 1, node = True)
+    def hits(self, ray, invert = False):
+        mask, distance_set, incident, normal = sphereKernel(ray.r, ray.v, self.center, self.radius, invert)
+        return mask, distance_set, _v3(*incident), _v3(*normal)
+    
+    def uv(self, points, invert = False):
+        normal = (points - self.center).unit()
         if invert:
-            normal_set = normal_set * -1
-        
-        u_set = np.arctan2(normal_set.y, normal_set.x) / (2.0 * np.pi)
-        v_set = np.arccos(normal_set.z) / np.pi
+            normal = normal * -1
         
-        collisions = CollisionResult(area)
-        collisions.place(mask, incident_set, normal_set, u_set, v_set)
-        
-        self.setMatHash(collisions)
-        
-        return collisions
+        u = np.arctan2(normal.y, normal.x) / (2.0 * np.pi)
+        v = np.arccos(normal.z) / np.pi
+        return u, v
     
+    @profiled('interior', ray = 1, node = True)
     def interior(self, point):
         x = point - self.center
         return x.normsq() < self.radius ** 2
 
+    def computeBounds(self):
+        extent = V3(self.radius, self.radius, self.radius)
+        return AABB(self.center - extent, self.center + extent)
 
-class Union(Geometry):
+
+class Empty(Geometry):
+    
+    # the result of pruning a CSG subtree that can never be hit
     
-    def __init__(self, fst, snd, material=None):
+    def __init__(self, material=None):
         super().__init__(material=material)
-        self.fst = fst
-        self.snd = snd
     
     def intersections(self, ray, invert = False):
-        collisions_fst = self.fst.intersections(ray, invert)
-        collisions_snd = self.snd.intersections(ray, invert)
-        collisions = collisions_fst
-        collisions.takeNearer(collisions_snd)
-        self.setMatHash(collisions)
-        return collisions
+        return CollisionResult(len(ray))
+    
+    def intersectInto(self, ray, nearest, indices = None, invert = False):
+        pass
+    
+    def occludes(self, ray, tmax):
+        return np.zeros(len(ray), dtype = bool)
     
     def interior(self, point):
-        interior_fst = self.fst.interior(point)
-        interior_snd = self.snd.interior(point)
-        return np.logical_or(interior_fst, interior_snd)
+        return np.zeros(len(point), dtype = bool)
+    
+    def cost(self):
+        return 0
+    
+    def computeBounds(self):
+        return emptyBox()
+
 
+def _disjoint(objects):
+    box = objects[0].bounds()
+    for obj in objects[1:]:
+        box = box.intersection(obj.bounds())
+    return box.isEmpty()
 
-class Difference(Geometry):
+
+class Composite(Geometry):
     
-    def __init__(self, positive, negative, material=None):
+    def __init__(self, material=None):
         super().__init__(material=material)
-        self.positive = positive
-        self.negative = negative
     
+    def checkObjects(self, objects):
+        # members are taken positionally, a material given the same way would
+        # otherwise only fail once the scene is traced
+        for obj in objects:
+            if not isinstance(obj, Geometry):
+                raise TypeError('%s members must be geometry, got %r; material is keyword-only, as in %s(..., material = ...).' % (
+                    type(self).__name__, obj, type(self).__name__
+                ))
+    
+    @profiled('intersections', ray = 1, node = True)
     def intersections(self, ray, invert = False):
-        collisions_p = self.positive.intersections(ray, invert)
-        mask_p = self.negative.interior(collisions_p.incd)
-        collisions_p.incd.place(mask_p, V3(np.inf, np.inf, np.inf))
+        box = self.bounds()
+        if not box.isFinite():
+            return self.combine(ray, invert)
         
-        collisions_n = self.negative.intersections(ray, not invert)
-        mask_n = np.logical_not(self.positive.interior(collisions_n.incd))
-        collisions_n.incd.place(mask_n, V3(np.inf, np.inf, np.inf))
+        # rays missing the box of this subtree never reach its leaves
+        mask = box.hit(ray)
+        if mask.all():
+            return self.combine(ray, invert)
         
-        collisions = collisions_p
-        collisions.takeNearer(collisions_n)
+        collisions = CollisionResult(len(ray))
+        if mask.any():
+            collisions.put(np.flatnonzero(mask), self.combine(ray.extract(mask), invert))
+        self.setMatId(collisions)
+        return collisions
+
+    def simplified(self, obj):
+        # a node reduced to a single child keeps its material override
+        if isinstance(obj, Empty) or self.material is None:
+            return obj
+        return Union(obj, material = self.material)
+    
+    def merged(self, children):
+        # children of the same kind without a material of their own are
+        # merged into this node, keeping generated trees shallow
+        objects = []
+        for obj in children:
+            if type(obj) is type(self) and obj.material is None:
+                objects.extend(obj.objects)
+            else:
+                objects.append(obj)
+        return objects
+
+
+class Union(Composite):
+    
+    def __init__(self, *objects, material=None):
+        super().__init__(material=material)
+        self.checkObjects(objects)
+        self.objects = list(objects)
+        self.bvh = None
+    
+    def combine(self, ray, invert = False):
+        # the members write into one buffer, found through a hierarchy of their
+        # boxes since flattened unions have no nested boxes of their own
+        collisions = CollisionResult(len(ray))
+        self.hierarchy().collide(ray, collisions, invert)
+        self.setMatId(collisions)
+        return collisions
+    
+    def hierarchy(self):
+        if self.bvh is None:
+            self.bvh = BVH(self.objects)
+        return self.bvh
+    
+    def children(self):
+        return tuple(self.objects)
+    
+    def setChildren(self, children):
+        self.objects = list(children)
+    
+    def prepare(self):
+        super().prepare()
+        self.bvh = None
+    
+    def optimize(self, children):
+        # nested unions are merged into this one and empty members are dropped
+        objects = [obj for obj in self.merged(children) if not isinstance(obj, Empty)]
+        if not objects:
+            return Empty()
+        if len(objects) == 1 and self.material is None:
+            return objects[0]
+        return self.withChildren(objects)
+    
+    def interior(self, point):
+        return self.hierarchy().interior(point)
+    
+    def computeBounds(self):
+        box = emptyBox()
+        for obj in self.objects:
+            box = box.union(obj.bounds())
+        return box
+
+
+class _Negative:
+    
+    # a negative of a difference, whose surface only counts inside the
+    # positive and outside the other negatives
+    
+    def __init__(self, difference, obj):
+        self.difference = difference
+        self.obj = obj
+    
+    def bounds(self):
+        return self.obj.bounds()
+    
+    def interior(self, point):
+        return self.obj.interior(point)
+    
+    def intersectInto(self, ray, nearest, indices = None, invert = False):
+        collisions = self.obj.intersections(ray, invert)
+        hit = np.flatnonzero(collisions.t != np.inf)
+        point = collisions.incd.take(hit)
+        outside = np.logical_or(
+            np.logical_not(self.difference.positive.interior(point)),
+            self.difference.hierarchy().interior(point, exclude = self)
+        )
+        mask = np.zeros(len(ray), dtype = bool)
+        np.put(mask, np.extract(outside, hit), True)
+        collisions.discard(mask)
+        if indices is None:
+            nearest.takeNearer(collisions)
+        else:
+            nearest.takeNearerAt(indices, collisions)
+
+
+class Difference(Composite):
+    
+    def __init__(self, positive, *negatives, material=None):
+        super().__init__(material=material)
+        self.checkObjects((positive,) + negatives)
+        self.positive = positive
+        self.negatives = list(negatives)
+        self.bvh = None
+    
+    def combine(self, ray, invert = False):
+        collisions = self.positive.intersections(ray, invert)
+        mask_p = self.hierarchy().interior(collisions.incd)
+        collisions.discard(mask_p)
         
-        self.setMatHash(collisions)
+        # the negatives are found through a hierarchy of their boxes and only
+        # rays through a box are traced against its negative
+        self.hierarchy().collide(ray, collisions, not invert)
+        
+        self.setMatId(collisions)
         
         return collisions
     
+    def hierarchy(self):
+        if self.bvh is None:
+            self.bvh = BVH([_Negative(self, obj) for obj in self.negatives])
+        return self.bvh
+    
+    def children(self):
+        return (self.positive,) + tuple(self.negatives)
+    
+    def setChildren(self, children):
+        self.positive = children[0]
+        self.negatives = list(children[1:])
+    
+    def prepare(self):
+        super().prepare()
+        self.bvh = None
+    
+    def optimize(self, children):
+        # a chain of differences removes all its negatives from the innermost
+        # positive, and negatives outside the box of the positive never remove
+        # anything
+        positive = children[0]
+        merged = []
+        if isinstance(positive, Difference) and positive.material is None:
+            merged = positive.negatives
+            positive = positive.positive
+        if isinstance(positive, Empty):
+            return positive
+        
+        negatives = merged + [
+            obj for obj in children[1:]
+            if not (isinstance(obj, Empty) or _disjoint([positive, obj]))
+        ]
+        if not negatives:
+            return self.simplified(positive)
+        return self.withChildren([positive] + negatives)
+    
     def interior(self, point):
         return np.logical_and(
             self.positive.interior(point),
             np.logical_not(
-                self.negative.interior(point)
+                self.hierarchy().interior(point)
             )
         )
 
+    def computeBounds(self):
+        return self.positive.bounds()
+
 
-class Intersection(Geometry):
+class Intersection(Composite):
     
-    def __init__(self, fst, snd, material=None):
+    def __init__(self, *objects, material=None):
         super().__init__(material=material)
-        self.fst = fst
-        self.snd = snd
+        # the intersection of no members would be all of space
+        if not objects:
+            raise TypeError('Intersection needs at least one member, as Difference needs a positive.')
+        self.checkObjects(objects)
+        self.objects = list(objects)
     
-    def intersections(self, ray, invert = False):
-        collisions_1 = self.fst.intersections(ray, invert)
-        mask_1 = np.logical_not(self.snd.interior(collisions_1.incd))
-        collisions_1.incd.place(mask_1, V3(np.inf, np.inf, np.inf))
-        
-        collisions_2 = self.snd.intersections(ray, invert)
-        mask_2 = np.logical_not(self.fst.interior(collisions_2.incd))
-        collisions_2.incd.place(mask_2, V3(np.inf, np.inf, np.inf))
-        
-        collisions = collisions_1
-        
-        mask = collisions_2.incd.normsq() < collisions_1.incd.normsq()
-        collisions.copyfrom(mask, collisions_2)
+    def combine(self, ray, invert = False):
+        # members are traced cheapest first into one buffer and only for the
+        # live rays, rays that neither hit a member nor start in its box never
+        # pass through the intersection
+        collisions = CollisionResult(len(ray))
+        live = np.arange(len(ray))
+        objects = sorted(self.objects, key = lambda obj: obj.cost())
+        tests = list(objects)
+        for obj in objects:
+            ray_i = ray if len(live) == len(ray) else ray.take(live)
+            collisions_i = obj.intersections(ray_i, invert)
+            hit = collisions_i.t != np.inf
+            
+            # hits on the surface of a member count if they are nearer than the
+            # ones found so far and inside all the other members, points are
+            # dropped from the tests as soon as they are outside of one; the
+            # members that dropped points are tried first for the next member,
+            # whose points tend to lie outside of the same ones
+            candidates = np.flatnonzero(np.logical_and(hit, collisions_i.t < np.take(collisions.t, live)))
+            point = collisions_i.incd.take(candidates)
+            for k, other in enumerate(list(tests)):
+                if len(candidates) == 0:
+                    break
+                if other is not obj:
+                    inside = other.interior(point)
+                    if not inside.all():
+                        candidates = np.extract(inside, candidates)
+                        point = point.extract(inside)
+                        tests.insert(0, tests.pop(k))
+            if len(candidates):
+                mask = np.zeros(len(live), dtype = bool)
+                np.put(mask, candidates, True)
+                collisions.takeNearerAt(np.extract(mask, live), collisions_i.extract(mask))
+            
+            missed = np.flatnonzero(np.logical_not(hit))
+            np.put(hit, missed, obj.bounds().contains(ray_i.r.take(missed)))
+            live = np.extract(hit, live)
+            if len(live) == 0:
+                break
         
-        self.setMatHash(collisions)
+        self.setMatId(collisions)
         
         return collisions
     
+    def children(self):
+        return tuple(self.objects)
+    
+    def setChildren(self, children):
+        self.objects = list(children)
+    
+    def optimize(self, children):
+        # nested intersections are merged into this one, members with
+        # disjoint boxes have nothing in common
+        objects = self.merged(children)
+        if any(isinstance(obj, Empty) for obj in objects) or _disjoint(objects):
+            return Empty()
+        if len(objects) == 1:
+            return self.simplified(objects[0])
+        return self.withChildren(objects)
+    
     def interior(self, point):
-        in_fst = self.fst.interior(point)
-        in_snd = self.snd.interior(point)
-        return np.logical_and(in_fst, in_snd)
+        # only the points inside all the members so far are tested further
+        inside = np.ones(len(point), dtype = bool)
+        indices = np.arange(len(point))
+        for obj in sorted(self.objects, key = lambda obj: obj.cost()):
+            mask = obj.interior(point)
+            if not mask.all():
+                np.put(inside, np.extract(np.logical_not(mask), indices), False)
+                indices = np.extract(mask, indices)
+                if len(indices) == 0:
+                    break
+                point = point.extract(mask)
+        return inside
+
+    def computeBounds(self):
+        box = unboundedBox()
+        for obj in self.objects:
+            box = box.intersection(obj.bounds())
+        return box
 
 
 class Transformation(Geometry):
@@ -208,16 +537,109 @@ class Transformation(Geometry):
     def __init__(self, material=None):
         super().__init__(material=material)
     
+    @profiled('intersections', ray = 1, node = True)
     def intersections(self, ray, invert = False):
         ray_p = ray.transform(self.inverse)
         collisions_p = self.obj.intersections(ray_p, invert)
         collisions = collisions_p.transform(self.transform)
-        self.setMatHash(collisions)
+        
+        # distances along the unit direction in object space differ from world space
+        mask = (collisions.t != np.inf)
+        np.place(collisions.t, mask, (collisions.incd.extract(mask) - ray.r.extract(mask)).dot(ray.v.extract(mask)))
+        
+        self.setMatId(collisions)
         return collisions
     
+    def children(self):
+        return (self.obj,)
+    
+    def setChildren(self, children):
+        self.obj, = children
+    
+    def optimize(self, children):
+        obj, = children
+        if isinstance(obj, Empty):
+            return obj
+        return self.withChildren(children)
+    
+    def flatten(self, children):
+        # the transforms of a chain are multiplied into one affine transform,
+        # the outermost material of the chain overrides the ones inside it;
+        # the chain below this node is already fused into the child
+        obj, = children
+        if not isinstance(obj, Transformation):
+            return self.withChildren(children)
+        
+        transform = AffineTransform(self.transform.toMatrix() @ obj.transform.toMatrix())
+        material = self.material if self.material is not None else obj.material
+        return Affine(transform, obj.obj, material = material)
+    
+    def prepare(self):
+        super().prepare()
+        self.transform.prepare()
+        self.inverse = self.transform.inverse()
+    
     def interior(self, point):
         point_p = self.inverse.apply(point)
         return self.obj.interior(point_p)
+    
+    def computeBounds(self):
+        return self.obj.bounds().transform(self.transform)
+
+
+def _distributed(root):
+    # transformations of CSG nodes are moved onto their members, so that CSG
+    # nodes alternating with transformations become nested CSG nodes of the
+    # same kind, which are merged into n-ary nodes and traced without
+    # recursing once per level; nested unions and intersections are merged
+    # here already, nested differences by the optimizer. The tree is walked
+    # top down with an explicit stack, every member carrying the product of
+    # the transforms above it, and a transformation with a material passes
+    # it on to the node below, as it overrides all the members of that node
+    if not any(isinstance(node, Transformation) and isinstance(node.obj, Composite) for node in postorder(root)):
+        return root
+    
+    # rebuilt nodes are kept by node and transform, so that subtrees shared
+    # under the same transforms stay shared
+    results = {}
+    done = []
+    stack = [(root, None, None, False)]
+    while stack:
+        node, matrix, material, expanded = stack.pop()
+        key = (id(node), id(matrix), material)
+        if expanded:
+            count = len(node.children())
+            children = done[len(done) - count:]
+            del done[len(done) - count:]
+            if isinstance(node, (Union, Intersection)):
+                children = node.merged(children)
+            if material is None:
+                result = node.withChildren(children)
+            else:
+                result = node.duplicate(children)
+                result.material = material
+            results[key] = (result, matrix)
+            done.append(result)
+        elif key in results:
+            done.append(results[key][0])
+        elif isinstance(node, Transformation) and isinstance(node.obj, Composite):
+            product = node.transform.toMatrix()
+            if matrix is not None:
+                product = matrix @ product
+            stack.append((node.obj, product, material or node.material, False))
+        elif isinstance(node, Composite):
+            stack.append((node, matrix, material, True))
+            stack.extend((child, matrix, None, False) for child in reversed(node.children()))
+        else:
+            if matrix is None:
+                result = node
+            elif isinstance(node, Transformation):
+                result = Affine(matrix @ node.transform.toMatrix(), node.obj, material = material or node.material)
+            else:
+                result = Affine(matrix, node, material = material)
+            results[key] = (result, matrix)
+            done.append(result)
+    return done[0]
 
 
 class Translation(Transformation):
@@ -242,6 +664,182 @@ class Rotation(Transformation):
     
     def __init__(self, axisIndex, angle, obj, material=None):
         super().__init__(material=material)
-        self.transform = RotationHelper(axisIndex, angle)
+        if isinstance(axisIndex, V3):
+            self.transform = axisRotation(axisIndex, angle)
+        else:
+            self.transform = RotationHelper(axisIndex, angle)
         self.inverse = self.transform.inverse()
         self.obj = obj
+
+
+class Affine(Transformation):
+    
+    def __init__(self, transform, obj, material=None):
+        super().__init__(material=material)
+        if not isinstance(transform, AffineTransform):
+            transform = AffineTransform(transform)
+        self.transform = transform
+        self.inverse = self.transform.inverse()
+        self.obj = obj
+
+
+def _batchApply(matrices, v, offset = None):
+    # every row of v multiplied by its own matrix from the (n, 3, 3) stack
+    dtype = v.x.dtype
+    matrices = matrices.astype(dtype)
+    result = []
+    for i in range(3):
+        component = matrices[:, i, 0] * v.x
+        component += matrices[:, i, 1] * v.y
+        component += matrices[:, i, 2] * v.z
+        if offset is not None:
+            component += offset[:, i].astype(dtype)
+        result.append(component)
+    return _v3(*result)
+
+
+class _Instance:
+    
+    # one copy of the prototype, as seen by the hierarchy of instance boxes
+    
+    def __init__(self, instances, index, box):
+        self.instances = instances
+        self.index = index
+        self.box = box
+    
+    def bounds(self):
+        return self.box
+    
+    def interior(self, point):
+        inverse = self.instances.inverses[self.index:self.index + 1]
+        return self.instances.obj.interior(_batchApply(inverse[:, :3, :3], point, inverse[:, :3, 3]))
+
+
+class Instances(Geometry):
+    
+    # many copies of one prototype, each placed by its own transform; only the
+    # prototype and one matrix per copy are stored
+    
+    def __init__(self, obj, transforms, material=None):
+        super().__init__(material=material)
+        self.obj = obj
+        matrices = [t.toMatrix() if hasattr(t, 'toMatrix') else t for t in transforms]
+        if len(matrices) == 0:
+            matrices = np.zeros((0, 4, 4))
+        self.matrices = np.array(matrices, dtype = np.float64)
+        if self.matrices.shape[1:] != (4, 4):
+            raise ValueError('Instances take 4x4 transform matrices.')
+        self.prepare()
+    
+    def prepare(self):
+        super().prepare()
+        self.inverses = np.linalg.inv(self.matrices)
+        self.normals = normalMatrix(self.inverses)
+        self.boxes = None
+        self.bvh = None
+    
+    def __len__(self):
+        return len(self.matrices)
+    
+    @profiled('intersections', ray = 1, node = True)
+    def intersections(self, ray, invert = False):
+        collisions = CollisionResult(len(ray))
+        
+        # rays are grouped by the instance boxes they hit, every candidate ray
+        # is moved into the frame of its instance and the prototype traces all
+        # of them in one call
+        pairs = [(instance, indices) for instance, indices in self.hierarchy().candidates(ray) if len(indices)]
+        if not pairs:
+            self.setMatId(collisions)
+            return collisions
+        rays = np.concatenate([indices for instance, indices in pairs])
+        instance = np.concatenate([np.full(len(indices), obj.index) for obj, indices in pairs])
+        
+        inverses = self.inverses[instance]
+        ray_p = ray.take(rays)
+        ray_p = Ray(
+            _batchApply(inverses[:, :3, :3], ray_p.r, inverses[:, :3, 3]),
+            _batchApply(inverses[:, :3, :3], ray_p.v).unit(),
+            normalize = False
+        )
+        collisions_p = self.obj.intersections(ray_p, invert)
+        
+        # hits are moved back to world space and the nearest one of every ray
+        # is kept
+        hit = collisions_p.t != np.inf
+        collisions_p = collisions_p.extract(hit)
+        rays = np.extract(hit, rays)
+        instance = np.extract(hit, instance)
+        matrices = self.matrices[instance]
+        collisions_p.incd = _batchApply(matrices[:, :3, :3], collisions_p.incd, matrices[:, :3, 3])
+        collisions_p.norm = _batchApply(self.normals[instance], collisions_p.norm).unit()
+        collisions_p.t = (collisions_p.incd - ray.r.take(rays)).dot(ray.v.take(rays))
+        
+        order = np.lexsort((instance, collisions_p.t, rays))
+        first = np.ones(len(order), dtype = bool)
+        np.not_equal(rays[order[1:]], rays[order[:-1]], out = first[1:])
+        nearest = np.zeros(len(order), dtype = bool)
+        np.put(nearest, np.extract(first, order), True)
+        collisions.put(np.extract(nearest, rays), collisions_p.extract(nearest))
+        
+        self.setMatId(collisions)
+        return collisions
+    
+    def instanceBoxes(self):
+        # world boxes of all copies as (n, 3) arrays of corners
+        if self.boxes is None:
+            box = self.obj.bounds()
+            n = len(self.matrices)
+            if box.isEmpty():
+                lo, hi = np.full((n, 3), np.inf), np.full((n, 3), -np.inf)
+            elif not box.isFinite():
+                lo, hi = np.full((n, 3), -np.inf), np.full((n, 3), np.inf)
+            else:
+                corners = box.corners()
+                corners = np.array([corners.x, corners.y, corners.z], dtype = np.float64)
+                world = self.matrices[:, :3, :3] @ corners + self.matrices[:, :3, 3:]
+                lo, hi = world.min(axis = 2), world.max(axis = 2)
+            self.boxes = (lo, hi)
+        return self.boxes
+    
+    def hierarchy(self):
+        if self.bvh is None:
+            lo, hi = self.instanceBoxes()
+            self.bvh = BVH([
+                _Instance(self, k, AABB(V3(*lo[k]), V3(*hi[k])))
+                for k in range(len(self.matrices))
+            ])
+        return self.bvh
+    
+    def children(self):
+        return (self.obj,)
+    
+    def setChildren(self, children):
+        self.obj, = children
+    
+    def flatten(self, children):
+        # a transformation of the prototype is folded into the matrices
+        obj, = children
+        if not isinstance(obj, Transformation):
+            return self.withChildren(children)
+        material = self.material if self.material is not None else obj.material
+        return Instances(obj.obj, self.matrices @ obj.transform.toMatrix(), material = material)
+    
+    def optimize(self, children):
+        obj, = children
+        if isinstance(obj, Empty):
+            return obj
+        return self.withChildren(children)
+    
+    def cost(self):
+        return len(self.matrices) * self.obj.cost()
+    
+    def interior(self, point):
+        return self.hierarchy().interior(point)
+    
+    def computeBounds(self):
+        if len(self.matrices) == 0:
+            return emptyBox()
+        lo, hi = self.instanceBoxes()
+        lo, hi = lo.min(axis = 0), hi.max(axis = 0)
+        return AABB(V3(lo[0], lo[1], lo[2]), V3(hi[0], hi[1], hi[2]))
@@ -0,0 +1,225 @@
+import numpy as np
+from contextlib import contextmanager
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+_backend = {'name': 'numpy'}
+
+
+def kernelBackends():
+    if numba is None:
+        return ['numpy']
+    return ['numpy', 'numba']
+
+
+def getKernelBackend():
+    return _backend['name']
+
+
+def setKernelBackend(name):
+    if name not in kernelBackends():
+        raise ValueError('Kernel backend %s is not available.' % name)
+    _backend['name'] = name
+
+
+@contextmanager
+def kernelBackend(name):
+    # intersection kernels used by every primitive inside the block
+    previous = getKernelBackend()
+    setKernelBackend(name)
+    try:
+        yield
+    finally:
+        setKernelBackend(previous)
+
+
+# The kernels take the component arrays of the ray origins and directions
+# and return the hit mask over all rays followed by the values of the hit
+# subset only: distances, then hit points and normals as (3, n) arrays when
+# shading is requested. Texture coordinates are left to the primitives,
+# which compute them only for hits whose material needs them.
+
+
+def _compress3(mask, x, y, z):
+    return np.array([np.compress(mask, x), np.compress(mask, y), np.compress(mask, z)])
+
+
+def _sphereNumpy(rx, ry, rz, vx, vy, vz, cx, cy, cz, radius, invert, shade):
+    # buffers are reused in place, keeping the operation order of the V3
+    # expressions so that both backends round identically
+    xx = rx - cx
+    xy = ry - cy
+    xz = rz - cz
+    x_dot_v = xx * vx
+    tmp = xy * vy
+    x_dot_v += tmp
+    np.multiply(xz, vz, out = tmp)
+    x_dot_v += tmp
+    
+    rsq = radius ** 2
+    mask = x_dot_v < 0
+    if not invert:
+        x_normsq = xx * xx
+        np.multiply(xy, xy, out = tmp)
+        x_normsq += tmp
+        np.multiply(xz, xz, out = tmp)
+        x_normsq += tmp
+        np.logical_and(mask, x_normsq > rsq, out = mask)
+    
+    x_perp_normsq = np.multiply(x_dot_v, vx)
+    np.subtract(xx, x_perp_normsq, out = x_perp_normsq)
+    x_perp_normsq *= x_perp_normsq
+    for x, v in [(xy, vy), (xz, vz)]:
+        np.multiply(x_dot_v, v, out = tmp)
+        np.subtract(x, tmp, out = tmp)
+        tmp *= tmp
+        x_perp_normsq += tmp
+    np.logical_and(mask, x_perp_normsq <= rsq, out = mask)
+    
+    y_para_orientation = 1 if invert else -1
+    y_para_set = y_para_orientation * np.sqrt(rsq - np.compress(mask, x_perp_normsq))
+    distance_set = np.abs(np.compress(mask, x_dot_v) - y_para_set)
+    if not shade:
+        return mask, distance_set
+    
+    point = _compress3(mask, rx, ry, rz)
+    point += _compress3(mask, vx, vy, vz) * distance_set
+    normal = point - np.array([cx, cy, cz]).reshape(3, -1)
+    normal *= 1 / np.sqrt(normal[0] * normal[0] + normal[1] * normal[1] + normal[2] * normal[2])
+    if invert:
+        normal *= -1
+    return mask, distance_set, point, normal
+
+
+def _groundNumpy(rx, ry, rz, vx, vy, vz, position, normal, offset, shade):
+    px, py, pz = position
+    nx, ny, nz = normal
+    directions_para = nx * vx
+    directions_para += ny * vy
+    directions_para += nz * vz
+    directions_para *= -1
+    mask = directions_para > 0
+    
+    height = (rx - px) * nx
+    height += (ry - py) * ny
+    height += (rz - pz) * nz
+    np.logical_and(mask, height > 0, out = mask)
+    
+    positions_para = nx * rx
+    positions_para += ny * ry
+    positions_para += nz * rz
+    positions_para *= -1
+    
+    distance_set = (offset - np.compress(mask, positions_para)) / np.compress(mask, directions_para)
+    if not shade:
+        return mask, distance_set
+    
+    point = _compress3(mask, rx, ry, rz)
+    point += _compress3(mask, vx, vy, vz) * distance_set
+    return mask, distance_set, point
+
+
+def _sphereLoop(rx, ry, rz, vx, vy, vz, cx, cy, cz, radius, invert, shade):
+    n = len(rx)
+    mask = np.zeros(n, dtype = np.bool_)
+    distance = np.empty(n, dtype = rx.dtype)
+    point = np.empty((3, n), dtype = rx.dtype)
+    normal = np.empty((3, n), dtype = rx.dtype)
+    
+    rsq = radius ** 2
+    y_para_orientation = 1.0 if invert else -1.0
+    k = 0
+    for i in range(n):
+        xx = rx[i] - cx
+        xy = ry[i] - cy
+        xz = rz[i] - cz
+        x_dot_v = xx * vx[i] + xy * vy[i] + xz * vz[i]
+        if not x_dot_v < 0:
+            continue
+        perp_x = xx - x_dot_v * vx[i]
+        perp_y = xy - x_dot_v * vy[i]
+        perp_z = xz - x_dot_v * vz[i]
+        x_perp_normsq = perp_x * perp_x + perp_y * perp_y + perp_z * perp_z
+        if not x_perp_normsq <= rsq:
+            continue
+        if not (invert or xx * xx + xy * xy + xz * xz > rsq):
+            continue
+        
+        t = abs(x_dot_v - y_para_orientation * np.sqrt(rsq - x_perp_normsq))
+        mask[i] = True
+        distance[k] = t
+        if shade:
+            point[0, k] = rx[i] + vx[i] * t
+            point[1, k] = ry[i] + vy[i] * t
+            point[2, k] = rz[i] + vz[i] * t
+            dx = point[0, k] - cx
+            dy = point[1, k] - cy
+            dz = point[2, k] - cz
+            inv = 1 / np.sqrt(dx * dx + dy * dy + dz * dz)
+            if invert:
+                inv = -inv
+            normal[0, k] = dx * inv
+            normal[1, k] = dy * inv
+            normal[2, k] = dz * inv
+        k += 1
+    
+    return mask, distance[:k], point[:, :k], normal[:, :k]
+
+
+def _groundLoop(rx, ry, rz, vx, vy, vz, px, py, pz, nx, ny, nz, offset, shade):
+    n = len(rx)
+    mask = np.zeros(n, dtype = np.bool_)
+    distance = np.empty(n, dtype = rx.dtype)
+    point = np.empty((3, n), dtype = rx.dtype)
+    
+    k = 0
+    for i in range(n):
+        directions_para = -(nx * vx[i] + ny * vy[i] + nz * vz[i])
+        if not directions_para > 0:
+            continue
+        if not (rx[i] - px) * nx + (ry[i] - py) * ny + (rz[i] - pz) * nz > 0:
+            continue
+        
+        t = (offset + (nx * rx[i] + ny * ry[i] + nz * rz[i])) / directions_para
+        mask[i] = True
+        distance[k] = t
+        if shade:
+            point[0, k] = rx[i] + vx[i] * t
+            point[1, k] = ry[i] + vy[i] * t
+            point[2, k] = rz[i] + vz[i] * t
+        k += 1
+    
+    return mask, distance[:k], point[:, :k]
+
+
+if numba is not None:
+    _sphereLoop = numba.njit(cache = True)(_sphereLoop)
+    _groundLoop = numba.njit(cache = True)(_groundLoop)
+
+
+def _components(a, dtype):
+    # constants are cast to the ray precision so results keep that precision
+    return tuple(np.array([a.x[0], a.y[0], a.z[0]], dtype = dtype))
+
+
+def sphereKernel(r, v, center, radius, invert = False, shade = True):
+    args = (r.x, r.y, r.z, v.x, v.y, v.z) + _components(center, r.x.dtype) + (radius, bool(invert), shade)
+    if _backend['name'] == 'numba':
+        result = _sphereLoop(*args)
+        return result if shade else result[:2]
+    return _sphereNumpy(*args)
+
+
+def groundKernel(r, v, position, normal, offset, shade = True):
+    # offset is the distance of the plane from the origin
+    position = _components(position, r.x.dtype)
+    normal = _components(normal, r.x.dtype)
+    offset = r.x.dtype.type(np.asarray(offset).item())
+    if _backend['name'] == 'numba':
+        result = _groundLoop(r.x, r.y, r.z, v.x, v.y, v.z, *position, *normal, offset, shade)
+        return result if shade else result[:2]
+    return _groundNumpy(r.x, r.y, r.z, v.x, v.y, v.z, position, normal, offset, shade)
@@ -9,6 +9,10 @@ class AmbientLight:
     
     def illuminate(self, scene, collisions):
         return (self.color * self.brightness).repeat(collisions.area)
+    
+    def shadowRay(self, points):
+        # ambient light reaches every point, no ray is traced
+        return None
 
 
 class DirectionalLight:
@@ -22,14 +26,15 @@ class DirectionalLight:
         parallel = np.clip(self.direction.dot(collisions.norm) * -1, 0, 1)
         unshadowed = self.color * self.brightness * parallel
         
-        shadow_ray = Ray(
-            collisions.incd,
-            (self.direction * -1).repeat(collisions.area)
-        )
-        shadow_collisions = collide(collisions.area, shadow_ray, scene)
-        shadow_mask = (shadow_collisions.incd.normsq() == np.inf)
+        shadow_ray, tmax = self.shadowRay(collisions.incd)
+        shadow_mask = np.logical_not(occluded(shadow_ray, scene, tmax))
         
         return unshadowed * shadow_mask
+    
+    def shadowRay(self, points):
+        # the rays traced towards the light from the given points and their
+        # lengths, as tested by illuminate
+        return Ray(points, (self.direction * -1).repeat(len(points))), np.inf
 
 
 class PointLight:
@@ -45,11 +50,14 @@ class PointLight:
             collisions.incd,
             displacements.unit()
         )
-        shadow_collisions = collide(collisions.area, shadow_ray, scene)
         distsq = displacements.normsq()
-        shadow_mask = ((self.position - shadow_collisions.incd).normsq() > distsq)
+        shadow_mask = np.logical_not(occluded(shadow_ray, scene, np.sqrt(distsq)))
         
         parallel = np.clip(shadow_ray.v.dot(collisions.norm), 0, 1)
         unshadowed = self.color * self.brightness * parallel / distsq
         
         return unshadowed * shadow_mask
+
+    def shadowRay(self, points):
+        displacements = self.position - points
+        return Ray(points, displacements.unit()), displacements.norm()
\ No newline at end of file
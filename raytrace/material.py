@@ -3,6 +3,9 @@ import numpy as np
 
 class UniformMaterial:
     
+    # texture coordinates of the hits are only computed for materials that use them
+    needsUV = False
+    
     def __init__(self, color, reflectivity = 0.0):
         self.color = color
         self.reflectivity = reflectivity
@@ -22,6 +25,8 @@ class UniformMaterial:
 
 class CheckeredMaterial:
     
+    needsUV = True
+    
     def __init__(self, mat1, mat2, scale = 1.0):
         self.mat1 = mat1
         self.mat2 = mat2
@@ -39,4 +44,41 @@ class CheckeredMaterial:
         uflag = np.floor(us) % 2 == 0
         vflag = np.floor(vs) % 2 == 0
         use_first = np.logical_xor(uflag, vflag)
-        return np.where(use_first, self.mat1.getReflectivity(u, v), self.mat2.getReflectivity(u, v))
\ No newline at end of file
+        return np.where(use_first, self.mat1.getReflectivity(u, v), self.mat2.getReflectivity(u, v))
+
+
+class MaterialTable:
+    
+    def __init__(self, objects, materials):
+        self.objects = list(objects)
+        self.source = dict(materials)
+        
+        # id 0 means no material, scene materials are numbered from 1 in order
+        self.materials = [None] + list(self.source.values())
+        self.ids = {key: i + 1 for i, key in enumerate(self.source)}
+        
+        # the object trees are walked with an explicit stack, deep chains of
+        # transformations would otherwise hit the recursion limit, and
+        # subtrees shared by several parents are numbered once
+        seen = set()
+        stack = list(self.objects)
+        while stack:
+            node = stack.pop()
+            if id(node) in seen:
+                continue
+            seen.add(id(node))
+            if node.material is None:
+                node.matid = 0
+            else:
+                if node.material not in self.ids:
+                    # unknown materials keep their own id and shade black
+                    self.ids[node.material] = len(self.materials)
+                    self.materials.append(None)
+                node.matid = self.ids[node.material]
+            stack.extend(node.children())
+        
+        if len(self.materials) > np.iinfo(np.int16).max:
+            raise ValueError('Too many materials.')
+    
+    def id(self, key):
+        return self.ids.get(key, 0)
\ No newline at end of file
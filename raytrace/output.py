@@ -0,0 +1,130 @@
+import struct
+import zlib
+import numpy as np
+
+from .vector import *
+
+
+def tileArray(tile, window, dtype = np.uint8):
+    # the colors of a tile as a (rows, columns, 3) array, 8 bit colors are
+    # scaled to 0..255 and truncated
+    left, top, right, bottom = window
+    rgb = np.stack([tile.x, tile.y, tile.z], axis = -1).reshape(bottom - top, right - left, 3)
+    if np.dtype(dtype) == np.uint8:
+        return (rgb * 255).astype(np.uint8)
+    return rgb.astype(dtype)
+
+
+class MemmapSink:
+    
+    # tiles are written straight into an array of shape (height, width, 3)
+    # mapped from a file, only the pages of the current tile are in memory
+    
+    def __init__(self, array):
+        self.array = array
+    
+    def write(self, window, tile):
+        left, top, right, bottom = window
+        self.array[top:bottom, left:right] = tileArray(tile, window, self.array.dtype)
+    
+    def close(self):
+        if self.array is not None:
+            self.array.flush()
+            self.array = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *args):
+        self.close()
+
+
+class NpySink(MemmapSink):
+    
+    # a .npy file, float colors by default or 8 bit with dtype = np.uint8
+    
+    def __init__(self, path, resolution, dtype = np.float32):
+        super().__init__(np.lib.format.open_memmap(
+            path, mode = 'w+', dtype = dtype, shape = (resolution[1], resolution[0], 3)
+        ))
+
+
+class RawSink(MemmapSink):
+    
+    # headerless 8 bit RGB rows, top to bottom
+    
+    def __init__(self, path, resolution):
+        super().__init__(np.memmap(path, mode = 'w+', dtype = np.uint8, shape = (resolution[1], resolution[0], 3)))
+
+
+class PngSink:
+    
+    # an 8 bit RGB PNG written row by row; tiles are kept until the band of
+    # rows they belong to spans the image width, then the band is compressed
+    # and written out, so tiles must arrive band after band as tileWindows
+    # yields them
+    
+    def __init__(self, path, resolution, level = 6):
+        self.width, self.height = resolution
+        self.file = open(path, 'wb')
+        self.compressor = zlib.compressobj(level)
+        self.band = None
+        self.band_top = 0
+        self.filled = 0
+        self.rows = 0
+        
+        self.file.write(b'\x89PNG\r\n\x1a\n')
+        self.chunk(b'IHDR', struct.pack('>IIBBBBB', self.width, self.height, 8, 2, 0, 0, 0))
+    
+    def chunk(self, tag, data):
+        self.file.write(struct.pack('>I', len(data)))
+        self.file.write(tag + data)
+        self.file.write(struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff))
+    
+    def write(self, window, tile):
+        left, top, right, bottom = window
+        if self.band is None:
+            if top != self.rows:
+                raise ValueError('Tiles must arrive band after band, expected row %d.' % self.rows)
+            self.band = np.zeros((bottom - top, self.width, 3), dtype = np.uint8)
+            self.band_top = top
+            self.filled = 0
+        if top != self.band_top or bottom - top != len(self.band):
+            raise ValueError('Tiles must arrive band after band, expected row %d.' % self.band_top)
+        
+        self.band[:, left:right] = tileArray(tile, window)
+        self.filled += right - left
+        if self.filled == self.width:
+            self.writeRows(self.band)
+            self.band = None
+    
+    def writeRows(self, rows):
+        # every row starts with the byte of filter type 0, no filtering
+        data = np.zeros((len(rows), 1 + 3 * self.width), dtype = np.uint8)
+        data[:, 1:] = rows.reshape(len(rows), -1)
+        compressed = self.compressor.compress(data.tobytes())
+        if compressed:
+            self.chunk(b'IDAT', compressed)
+        self.rows += len(rows)
+    
+    def close(self):
+        if self.file is None:
+            return
+        try:
+            if self.rows != self.height:
+                raise ValueError('Only %d of %d rows were written.' % (self.rows, self.height))
+            self.chunk(b'IDAT', self.compressor.flush())
+            self.chunk(b'IEND', b'')
+        finally:
+            self.file.close()
+            self.file = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, kind, value, traceback):
+        if kind is None:
+            self.close()
+        elif self.file is not None:
+            self.file.close()
+            self.file = None
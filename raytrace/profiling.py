@@ -0,0 +1,224 @@
+import functools
+import time
+import tracemalloc
+import numpy as np
+from contextlib import contextmanager, nullcontext
+
+from .tree import *
+
+
+_active = {'stats': None}
+_disabled = nullcontext()
+
+
+class StageRecord:
+    
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.rays = 0
+        self.hits = 0
+        self.bytes = 0
+        # calls of the stage currently running, nested calls are not added
+        # to the totals of the stage a second time
+        self.running = 0
+    
+    def add(self, seconds, rays, hits, allocated):
+        self.calls += 1
+        self.seconds += seconds
+        self.rays += int(rays)
+        self.hits += int(hits)
+        self.bytes += allocated
+    
+    def merge(self, other):
+        self.calls += other.calls
+        self.seconds += other.seconds
+        self.rays += other.rays
+        self.hits += other.hits
+        self.bytes += other.bytes
+    
+    def asDict(self):
+        return {
+            'calls': self.calls,
+            'seconds': self.seconds,
+            'rays': self.rays,
+            'hits': self.hits,
+            'bytes': self.bytes
+        }
+
+
+class RenderStats:
+    
+    # time, rays, hits and allocated bytes per stage of the renderer and per
+    # node of the traced scene, collected while passed to render(); node
+    # times include the children of the node. Bytes are the peak of the
+    # memory traced by tracemalloc above its level when the stage started,
+    # i.e. the most the stage had allocated at once, and are only recorded
+    # with memory = True.
+    
+    def __init__(self, memory = False):
+        self.memory = memory
+        self.stages = {}
+        self.nodes = {}
+        self.labels = {}
+        # peaks of the running stages, innermost last; tracemalloc keeps a
+        # single peak, which is reset for every stage and folded back into
+        # the peak of the enclosing stage when the stage ends
+        self.peaks = []
+    
+    @contextmanager
+    def collecting(self, scene = None):
+        previous, labels = _active['stats'], self.labels
+        if scene is not None:
+            self.labels = sceneLabels(scene)
+        started = self.memory and not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        _active['stats'] = self
+        try:
+            yield self
+        finally:
+            _active['stats'] = previous
+            self.labels = labels
+            if started:
+                tracemalloc.stop()
+    
+    def startPeak(self):
+        if not self.memory:
+            return 0
+        current, peak = tracemalloc.get_traced_memory()
+        if self.peaks:
+            self.peaks[-1] = max(self.peaks[-1], peak)
+        tracemalloc.reset_peak()
+        self.peaks.append(current)
+        return current
+    
+    def endPeak(self, current):
+        if not self.memory:
+            return 0
+        peak = max(self.peaks.pop(), tracemalloc.get_traced_memory()[1])
+        if self.peaks:
+            self.peaks[-1] = max(self.peaks[-1], peak)
+        return peak - current
+    
+    def begin(self, stage):
+        record = self.stages.get(stage)
+        if record is None:
+            record = self.stages[stage] = StageRecord()
+        record.running += 1
+        return record, time.perf_counter(), self.startPeak()
+    
+    def end(self, token, rays, hits, node = None):
+        record, start, current = token
+        seconds = time.perf_counter() - start
+        allocated = self.endPeak(current)
+        record.running -= 1
+        if record.running == 0:
+            record.add(seconds, rays, hits, allocated)
+        
+        # nodes outside the traced scene, such as the flipped copies of
+        # grounds, are left out
+        label = self.labels.get(id(node)) if node is not None else None
+        if label is not None:
+            if label not in self.nodes:
+                self.nodes[label] = StageRecord()
+            self.nodes[label].add(seconds, rays, hits, allocated)
+    
+    @contextmanager
+    def block(self, stage, rays):
+        token = self.begin(stage)
+        try:
+            yield
+        finally:
+            self.end(token, rays, 0)
+    
+    def merge(self, other):
+        # the stats of another process, e.g. of a worker rendering tiles
+        for records, others in [(self.stages, other.stages), (self.nodes, other.nodes)]:
+            for key, record in others.items():
+                if key not in records:
+                    records[key] = StageRecord()
+                records[key].merge(record)
+    
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['labels'] = {}
+        state['peaks'] = []
+        return state
+    
+    def asDict(self):
+        return {
+            'stages': {key: record.asDict() for key, record in self.stages.items()},
+            'nodes': {key: record.asDict() for key, record in self.nodes.items()}
+        }
+    
+    def report(self):
+        lines = []
+        for title, records in [('stage', self.stages), ('node', self.nodes)]:
+            lines.append('%-24s %8s %10s %12s %12s %12s' % (title, 'calls', 'seconds', 'rays', 'hits', 'bytes'))
+            for key, record in sorted(records.items(), key = lambda item: -item[1].seconds):
+                lines.append('%-24s %8d %10.4f %12d %12d %12d' % (
+                    key, record.calls, record.seconds, record.rays, record.hits, record.bytes
+                ))
+        return '\n'.join(lines)
+
+
+def sceneLabels(scene):
+    # nodes are named by their position in the traced trees, which is the
+    # same in every process rendering a copy of the scene
+    labels = {}
+    for obj in scene.traced:
+        for node in postorder(obj):
+            if id(node) not in labels:
+                labels[id(node)] = '%d %s' % (len(labels), type(node).__name__)
+    return labels
+
+
+def activeStats():
+    return _active['stats']
+
+
+def hitCount(result):
+    # hits in the result of an instrumented call: the mask leading a tuple of
+    # primitive hits, the distances of a collision result or a boolean array
+    if isinstance(result, tuple):
+        result = result[0]
+    t = getattr(result, 't', None)
+    if t is not None:
+        return int(np.count_nonzero(t != np.inf))
+    if isinstance(result, np.ndarray) and result.dtype == bool:
+        return int(np.count_nonzero(result))
+    return 0
+
+
+def profiled(stage, ray = None, node = False):
+    # records the calls of a function under the stage while stats are
+    # collected; ray is the position of the argument holding the rays, or
+    # None to count the rays returned, and node marks methods of scene nodes
+    def decorate(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            stats = _active['stats']
+            if stats is None:
+                return f(*args, **kwargs)
+            token = stats.begin(stage)
+            result = None
+            try:
+                result = f(*args, **kwargs)
+                return result
+            finally:
+                if ray is not None:
+                    rays = len(args[ray])
+                else:
+                    rays = len(result) if result is not None else 0
+                stats.end(token, rays, hitCount(result), args[0] if node else None)
+        return wrapper
+    return decorate
+
+
+def profiledBlock(name, rays = 0):
+    # a block of code timed under the stage while stats are collected
+    stats = _active['stats']
+    if stats is None:
+        return _disabled
+    return stats.block(name, rays)
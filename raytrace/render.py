@@ -1,113 +1,577 @@
 import numpy as np
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
 from .vector import *
+from .kernels import *
 from .camera import *
 from .geometry import *
 from .material import *
 from .transform import *
+from .bvh import *
+from .scene import *
+from .tree import *
+from .profiling import *
 
 
 class CollisionResult:
     
     def __init__(self, area):
         self.area = area
-        self.mathash = np.repeat([0], area)
-        self.incd = V3(np.inf, np.inf, np.inf).repeat(area)
-        self.norm = V3(1, 0, 0).repeat(area)
-        self.u = np.repeat([0.0], area)
-        self.v = np.repeat([0.0], area)
+        self.matid = np.zeros(area, dtype = np.int16)
+        dtype = getPrecision()
+        self.t = np.full(area, np.inf, dtype = dtype)
+        self.incd = V3(np.full(area, np.inf), np.full(area, np.inf), np.full(area, np.inf))
+        self.norm = V3(np.ones(area), np.zeros(area), np.zeros(area))
         
-    def place(self, mask, incd, norm, u = np.array([0]), v = np.array([0])):
+        # texture coordinates are computed on demand from the hit point in the
+        # frame of the primitive that was hit, see uv()
+        self.local = V3(np.zeros(area), np.zeros(area), np.zeros(area))
+        self.uvsrc = np.full(area, -1, dtype = np.int32)
+        self.uvsources = []
+        self.uvindex = {}
+        
+    def uvIndex(self, source):
+        # sources are (primitive, invert) pairs, numbered per result
+        key = (id(source[0]), source[1])
+        index = self.uvindex.get(key)
+        if index is None:
+            index = len(self.uvsources)
+            self.uvsources.append(source)
+            self.uvindex[key] = index
+        return index
+    
+    def uvIndices(self, other):
+        # source numbers of other translated to the numbering of this result
+        table = np.array([self.uvIndex(source) for source in other.uvsources] + [-1], dtype = np.int32)
+        return np.take(table, other.uvsrc)
+    
+    def place(self, mask, t, incd, norm, source = None):
+        np.place(self.t, mask, t)
         self.incd.place(mask, incd)
         self.norm.place(mask, norm)
-        np.place(self.u, mask, u)
-        np.place(self.v, mask, v)
+        self.local.place(mask, incd)
+        if source is not None:
+            np.place(self.uvsrc, mask, self.uvIndex(source))
         
     def copyfrom(self, mask, other):
-        np.copyto(self.mathash, other.mathash, where = mask)
+        np.copyto(self.matid, other.matid, where = mask)
+        np.copyto(self.t, other.t, where = mask)
         self.incd.copyfrom(other.incd, where = mask)
         self.norm.copyfrom(other.norm, where = mask)
-        np.copyto(self.u, other.u, where = mask)
-        np.copyto(self.v, other.v, where = mask)
+        self.local.copyfrom(other.local, where = mask)
+        np.copyto(self.uvsrc, self.uvIndices(other), where = mask)
+    
+    def put(self, indices, other):
+        np.put(self.matid, indices, other.matid)
+        np.put(self.t, indices, other.t)
+        self.incd.put(indices, other.incd)
+        self.norm.put(indices, other.norm)
+        self.local.put(indices, other.local)
+        np.put(self.uvsrc, indices, self.uvIndices(other))
+    
+    def setMatId(self, matid):
+        self.matid = np.full(self.area, matid, dtype = np.int16)
     
-    def setMatHash(self, mathash):
-        self.mathash = np.repeat([mathash], self.area)
+    def discard(self, mask):
+        np.place(self.t, mask, np.inf)
+        self.incd.place(mask, V3(np.inf, np.inf, np.inf))
     
     def takeNearer(self, other):
-        mask = other.incd.normsq() < self.incd.normsq()
+        mask = other.t < self.t
         self.copyfrom(mask, other)
     
+    def takeNearerAt(self, indices, other):
+        # other holds collisions of the rays at the given indices only
+        mask = other.t < np.take(self.t, indices)
+        targets = np.extract(mask, indices)
+        np.put(self.matid, targets, np.extract(mask, other.matid))
+        np.put(self.t, targets, np.extract(mask, other.t))
+        self.incd.put(targets, other.incd.extract(mask))
+        self.norm.put(targets, other.norm.extract(mask))
+        self.local.put(targets, other.local.extract(mask))
+        np.put(self.uvsrc, targets, np.extract(mask, self.uvIndices(other)))
+    
+    def putNearer(self, indices, t, incd, norm, matid, source = None):
+        # the nearest hit found so far is the t-max of every ray, farther hits are dropped
+        mask = t < np.take(self.t, indices)
+        targets = np.extract(mask, indices)
+        np.put(self.matid, targets, matid)
+        np.put(self.t, targets, np.extract(mask, t))
+        incd = incd.extract(mask)
+        self.incd.put(targets, incd)
+        self.norm.put(targets, norm.extract(mask))
+        self.local.put(targets, incd)
+        if source is not None:
+            np.put(self.uvsrc, targets, self.uvIndex(source))
+    
+    def uv(self, indices):
+        # texture coordinates of the given hits, grouped by the primitive hit
+        uvsrc = np.take(self.uvsrc, indices)
+        local = self.local.take(indices)
+        u = np.zeros(len(uvsrc), dtype = self.t.dtype)
+        v = np.zeros(len(uvsrc), dtype = self.t.dtype)
+        for index in np.unique(uvsrc):
+            if index < 0:
+                continue
+            primitive, invert = self.uvsources[index]
+            select = (uvsrc == index)
+            u_set, v_set = primitive.uv(local.extract(select), invert)
+            np.place(u, select, np.asarray(u_set, dtype = u.dtype))
+            np.place(v, select, np.asarray(v_set, dtype = v.dtype))
+        return u, v
+    
     def transform(self, transform):
         result = CollisionResult(self.area)
-        result.mathash = self.mathash
-        result.incd = transform.applyToDifference(self.incd)
-        result.norm = transform.applyToNormal(self.norm)
-        result.u = self.u
-        result.v = self.v
+        result.matid = self.matid
+        result.t = self.t
+        
+        # misses keep their infinite points, transforming them would give nan
+        # from 0 * inf wherever the matrix has zeros
+        hit = np.flatnonzero(self.t != np.inf)
+        if len(hit) == self.area:
+            result.incd = transform.apply(self.incd)
+            result.norm = transform.applyToNormal(self.norm)
+        elif len(hit):
+            result.incd.put(hit, transform.apply(self.incd.take(hit)))
+            result.norm.put(hit, transform.applyToNormal(self.norm.take(hit)))
+        result.local = self.local
+        result.uvsrc = self.uvsrc
+        result.uvsources = list(self.uvsources)
+        result.uvindex = dict(self.uvindex)
         return result
     
     def extract(self, mask):
         result = CollisionResult(np.sum(mask))
-        result.mathash = np.extract(mask, self.mathash)
+        result.matid = np.extract(mask, self.matid)
+        result.t = np.extract(mask, self.t)
         result.incd = self.incd.extract(mask)
         result.norm = self.norm.extract(mask)
-        result.u = np.extract(mask, self.u)
-        result.v = np.extract(mask, self.v)
+        result.local = self.local.extract(mask)
+        result.uvsrc = np.extract(mask, self.uvsrc)
+        result.uvsources = list(self.uvsources)
+        result.uvindex = dict(self.uvindex)
         return result
 
 
+@profiled('collide', ray = 1)
 def collide(area, ray, scene):
     nearest_collisions = CollisionResult(area)
-    for i, obj in enumerate(scene['objects']):
-        obj_collisions = obj.intersections(ray)
-        nearest_collisions.takeNearer(obj_collisions)
+    compileScene(scene).bvh.collide(ray, nearest_collisions)
     return nearest_collisions
 
 
-def render(camera, scene, bounce = 4):
-    area = camera.area()
+@profiled('shadows', ray = 0)
+def occluded(ray, scene, tmax = np.inf):
+    tmax = np.broadcast_to(tmax, (len(ray),))
+    blocked = np.zeros(len(ray), dtype = bool)
+    compileScene(scene).bvh.occlude(ray, tmax, blocked)
+    return blocked
+
+
+def render(camera, scene, bounce = 4, tile_size = None, workers = None, dtype = None, stats = None, sink = None):
+    if dtype is not None:
+        with precision(dtype):
+            return render(camera, scene, bounce, tile_size, workers, stats = stats, sink = sink)
+    
+    # scene dictionaries are compiled once and reused by later calls
+    scene = compileScene(scene)
+    
+    # stats record everything traced for this call, see RenderStats
+    if stats is not None and activeStats() is not stats:
+        with stats.collecting(scene):
+            return render(camera, scene, bounce, tile_size, workers, stats = stats, sink = sink)
+    
+    if workers is not None:
+        return renderParallel(camera, scene, bounce, tile_size or 64, workers, stats, sink)
+    
+    if tile_size is None and sink is None:
+        return renderRays(camera.rays(), scene, bounce)
+    
+    # trace one screen tile at a time so that memory is bounded by the tile size;
+    # with a sink, see output.py, finished tiles are handed to it instead of
+    # being kept and the sink is returned
+    raster = V3(0, 0, 0).repeat(camera.area()) if sink is None else None
+    for window in tileWindows(camera.resolution, tile_size or 64):
+        pixels = windowPixels(camera.resolution, window)
+        tile = renderRays(camera.rays(pixels), scene, bounce)
+        if sink is None:
+            raster.put(pixels, tile)
+        else:
+            sink.write(window, tile)
+    
+    return raster if sink is None else sink
+
+
+def renderProgressive(camera, scene, bounce = 4, steps = (8, 4, 2, 1), tile_size = None, workers = None, dtype = None, stats = None):
+    # a generator of full size rasters: each step traces the pixels on a grid
+    # of the given spacing that earlier steps did not trace, and the pixels in
+    # between show the sample at the corner of their grid cell; with a last
+    # step of 1 every pixel is traced once and the last raster equals render()
+    scene = compileScene(scene)
+    width = camera.resolution[0]
+    rows, cols = np.divmod(np.arange(camera.area()), width)
+    traced = np.zeros(camera.area(), dtype = bool)
+    raster = None
+    
+    for step in steps:
+        grid = np.logical_and(rows % step == 0, cols % step == 0)
+        pixels = np.flatnonzero(np.logical_and(grid, np.logical_not(traced)))
+        with precision(dtype or getPrecision()):
+            samples = render(CameraPrecomputed(camera.rays(pixels)), scene, bounce, tile_size, workers, stats = stats)
+            if raster is None:
+                raster = V3(0, 0, 0).repeat(camera.area())
+            raster.put(pixels, samples)
+            traced |= grid
+            
+            corners = (rows - rows % step) * width + (cols - cols % step)
+            frame = raster.take(corners)
+        yield frame
+
+
+def edgePixels(resolution, color, t, matid, threshold = 0.1, depth_threshold = 0.1):
+    # pixels whose color, material or relative depth differs from a horizontal
+    # or vertical neighbour by more than the thresholds
+    shape = (resolution[1], resolution[0])
+    channels = [c.reshape(shape) for c in (color.x, color.y, color.z)]
+    t = t.reshape(shape)
+    matid = matid.reshape(shape)
+    edges = np.zeros(shape, dtype = bool)
+    
+    with np.errstate(invalid = 'ignore'):
+        for first, second in [
+            ((slice(None), slice(1, None)), (slice(None), slice(None, -1))),
+            ((slice(1, None), slice(None)), (slice(None, -1), slice(None)))
+        ]:
+            differs = matid[first] != matid[second]
+            for c in channels:
+                differs |= np.abs(c[first] - c[second]) > threshold
+            differs |= np.abs(t[first] - t[second]) > depth_threshold * np.minimum(t[first], t[second])
+            edges[first] |= differs
+            edges[second] |= differs
+    
+    return np.flatnonzero(edges)
+
+
+def renderAdaptive(camera, scene, bounce = 4, samples = 4, threshold = 0.1, depth_threshold = 0.1, dtype = None, stats = None):
+    # one ray per pixel center first, then samples x samples stratified rays
+    # for the pixels on edges, see edgePixels; returns the raster and a
+    # report of the camera rays spent against uniform supersampling
+    if dtype is not None:
+        with precision(dtype):
+            return renderAdaptive(camera, scene, bounce, samples, threshold, depth_threshold, stats = stats)
+    
+    if not hasattr(camera, 'pixelRays'):
+        raise ValueError('Adaptive sampling needs a camera with pixelRays.')
+    
+    scene = compileScene(scene)
+    if stats is not None and activeStats() is not stats:
+        with stats.collecting(scene):
+            return renderAdaptive(camera, scene, bounce, samples, threshold, depth_threshold, stats = stats)
     ray = camera.rays()
+    collisions = collide(len(ray), ray, scene)
+    raster = renderRays(ray, scene, bounce, collisions)
+    edges = edgePixels(camera.resolution, raster, collisions.t, collisions.matid, threshold, depth_threshold)
+    
+    # offsets of the stratum centers inside a pixel, relative to its center
+    offsets = (np.arange(samples) + 0.5) / samples - 0.5
+    dx = np.tile(offsets, samples)
+    dy = np.repeat(offsets, samples)
+    
+    # the edge pixels are supersampled in batches of bounded size
+    batch = max(1, 65536 // (samples * samples))
+    for start in range(0, len(edges), batch):
+        pixels = edges[start:start + batch]
+        px, py = pixelCenters(camera.resolution, pixels)
+        px = (px[:, np.newaxis] + dx).ravel().astype(px.dtype)
+        py = (py[:, np.newaxis] + dy).ravel().astype(py.dtype)
+        colors = renderRays(camera.pixelRays(px, py), scene, bounce)
+        mean = [c.reshape(len(pixels), -1).mean(axis = 1) for c in (colors.x, colors.y, colors.z)]
+        raster.put(pixels, V3(*mean))
+    
+    report = {
+        'pixels': camera.area(),
+        'edges': len(edges),
+        'rays': camera.area() + len(edges) * samples * samples,
+        'uniform': camera.area() * samples * samples
+    }
+    return raster, report
+
+
+class AnimationRenderer:
+    
+    # renders the frames of an animation whose objects are changed in place
+    # between frames; every frame after the first re-traces only the pixels
+    # whose camera, reflected or shadow rays of the previous frame pass
+    # through the old or new box of a changed object, the other pixels keep
+    # their color
+    
+    def __init__(self, camera, scene, bounce = 4):
+        self.camera = camera
+        self.scene = compileScene(scene)
+        self.bounce = bounce
+        self.raster = None
+        self.paths = None
+        self.retraced = 0
+    
+    def frame(self, changed = None):
+        # changed lists the nodes modified since the last frame, anywhere in
+        # the trees of the scene objects; None traces every pixel
+        scene = self.scene
+        if self.raster is None or changed is None:
+            scene.update()
+            return self.trace(np.arange(self.camera.area()))
+        
+        # the boxes cached by the last compile are the old ones
+        indices = self.objectIndices(changed)
+        boxes = [scene.traced[i].bounds() for i in indices]
+        scene.update()
+        boxes += [scene.traced[i].bounds() for i in indices]
+        return self.trace(np.flatnonzero(self.affected(boxes)))
+    
+    def objectIndices(self, changed):
+        # positions of the scene objects whose trees hold the changed nodes
+        changed = set(id(node) for node in changed)
+        indices = [
+            i for i, obj in enumerate(self.scene.objects)
+            if any(id(node) in changed for node in postorder(obj))
+        ]
+        found = set(id(node) for i in indices for node in postorder(self.scene.objects[i]))
+        if not changed <= found:
+            raise ValueError('Changed nodes must belong to the objects of the scene.')
+        return indices
+    
+    def affected(self, boxes):
+        stale = np.zeros(self.camera.area(), dtype = bool)
+        for pixels, ray, t, points in self.paths:
+            for box in boxes:
+                stale[np.extract(_touches(box, ray, t), pixels)] = True
+            
+            # shadow rays from the hits towards every light
+            hits = np.extract(t != np.inf, pixels)
+            for light in self.scene.lighting:
+                if not hasattr(light, 'shadowRay'):
+                    stale[hits] = True
+                    continue
+                shadow = light.shadowRay(points)
+                if shadow is None:
+                    continue
+                shadow_ray, tmax = shadow
+                for box in boxes:
+                    stale[np.extract(_touches(box, shadow_ray, tmax), hits)] = True
+        return stale
+    
+    def trace(self, pixels):
+        self.retraced = len(pixels)
+        paths = []
+        colors = renderRays(self.camera.rays(pixels), self.scene, self.bounce, paths = paths)
+        
+        # the rays of every bounce are kept by the pixels they belong to,
+        # replacing those of the pixels traced again
+        paths = [(pixels[local], ray, t, points) for local, ray, t, points in paths]
+        if self.raster is None or len(pixels) == self.camera.area():
+            self.raster = colors
+            self.paths = paths
+            return self.raster.take(np.arange(len(colors)))
+        
+        self.raster.put(pixels, colors)
+        stale = np.zeros(self.camera.area(), dtype = bool)
+        stale[pixels] = True
+        merged = []
+        for depth in range(max(len(self.paths), len(paths))):
+            parts = []
+            if depth < len(self.paths):
+                old_pixels, ray, t, points = self.paths[depth]
+                keep = np.logical_not(stale[old_pixels])
+                parts.append((
+                    np.extract(keep, old_pixels),
+                    ray.extract(keep),
+                    np.extract(keep, t),
+                    points.extract(np.extract(t != np.inf, keep))
+                ))
+            if depth < len(paths):
+                parts.append(paths[depth])
+            merged.append((
+                np.concatenate([part[0] for part in parts]),
+                Ray(_joined([part[1].r for part in parts]), _joined([part[1].v for part in parts]), normalize = False),
+                np.concatenate([part[2] for part in parts]),
+                _joined([part[3] for part in parts])
+            ))
+        self.paths = merged
+        return self.raster.take(np.arange(self.camera.area()))
+
+
+def _touches(box, ray, tmax):
+    # rays whose segment up to tmax may pass through the box, with a margin
+    # for the rounding of hits on the faces of the box
+    tnear, tfar = box.slabs(ray)
+    margin = 1e-4 * (1 + tnear)
+    return np.logical_and(tnear <= tfar + margin, tnear <= tmax + margin)
+
+
+def _joined(vectors):
+    return V3(*[np.concatenate([getattr(v, c) for v in vectors]) for c in 'xyz'])
+
+
+_worker = {}
+
+
+def _initWorker(camera, scene, bounce, settings, memory = None):
+    # the scene is unpickled once per process instead of once per tile, the
+    # settings of the parent are applied first since spawned workers start
+    # from the defaults
+    dtype, name, backend = settings
+    setPrecision(dtype)
+    setLayout(name)
+    setKernelBackend(backend)
+    _worker['camera'] = camera
+    _worker['scene'] = scene
+    _worker['bounce'] = bounce
+    _worker['memory'] = memory
+
+
+def _renderTile(window):
+    camera = _worker['camera']
+    pixels = windowPixels(camera.resolution, window)
+    if _worker['memory'] is None:
+        return renderRays(camera.rays(pixels), _worker['scene'], _worker['bounce'])
+    
+    # with stats every tile returns its own, merged by the parent process
+    stats = RenderStats(memory = _worker['memory'])
+    with stats.collecting(_worker['scene']):
+        tile = renderRays(camera.rays(pixels), _worker['scene'], _worker['bounce'])
+    return tile, stats
+
+
+def renderParallel(camera, scene, bounce, tile_size, workers, stats = None, sink = None, context = None):
+    # context is the multiprocessing context of the workers, the default one if None
+    windows = iter(tileWindows(camera.resolution, tile_size))
+    raster = V3(0, 0, 0).repeat(camera.area()) if sink is None else None
+    
+    # the compiled scene, with its material ids and hierarchy, is shipped as is
+    with ProcessPoolExecutor(
+        max_workers = workers,
+        mp_context = context,
+        initializer = _initWorker,
+        initargs = (
+            camera, scene, bounce,
+            (getPrecision(), getLayout(), getKernelBackend()),
+            None if stats is None else stats.memory
+        )
+    ) as executor:
+        # tiles are taken in order, as sinks such as PngSink need them, and
+        # only a few are submitted ahead of the one taken next, so that tiles
+        # finished early wait in the parent a bounded number at a time
+        pending = deque()
+        while True:
+            while len(pending) < 2 * workers:
+                window = next(windows, None)
+                if window is None:
+                    break
+                pending.append((window, executor.submit(_renderTile, window)))
+            if not pending:
+                break
+            window, future = pending.popleft()
+            tile = future.result()
+            if stats is not None:
+                tile, tile_stats = tile
+                stats.merge(tile_stats)
+            if sink is None:
+                raster.put(windowPixels(camera.resolution, window), tile)
+            else:
+                sink.write(window, tile)
+    
+    return raster if sink is None else sink
+
+
+def renderRays(ray, scene, bounce, collisions = None, paths = None):
+    # collisions may hold the first hits of the rays when the caller needs them too,
+    # paths collects the rays of every bounce, see AnimationRenderer
+    materials = scene.materialtable
+    
+    # the bounces are traced front to back, every one keeping the rays it
+    # traced, the hits among them, their matte colors and reflectivities;
+    # pixels are those the live rays of the current bounce belong to
+    layers = []
+    pixels = np.arange(len(ray))
+    
+    for depth in range(bounce + 1):
+        with profiledBlock('bounce %d' % depth, len(ray)):
+            if depth == 0 and collisions is not None:
+                all_collisions = collisions
+            else:
+                all_collisions = collide(len(ray), ray, scene)
+            collision_mask = (all_collisions.t != np.inf)
+            sub_area = np.sum(collision_mask)
+            if paths is not None:
+                paths.append((pixels, ray, all_collisions.t, all_collisions.incd.extract(collision_mask)))
+            if sub_area == 0:
+                layers.append((len(ray), np.zeros(0, dtype = int), V3(0, 0, 0).repeat(0), np.zeros(0)))
+                break
+            collisions = all_collisions.extract(collision_mask)
+            pixels = np.extract(collision_mask, pixels)
+    
+            # lighting and texturing
+    
+            lighting = V3(0, 0, 0).repeat(sub_area)
+            with profiledBlock('lighting', sub_area):
+                for light in scene.lighting:
+                    lighting += light.illuminate(scene, collisions)
+    
+            with profiledBlock('shading', sub_area):
+                matte_component = V3(0, 0, 0).repeat(sub_area)
+    
+                frac_reflective = np.zeros(sub_area, dtype = getPrecision())
+        
+                # hits sorted by material id, each material shades one contiguous run
+                order = np.argsort(collisions.matid, kind = 'stable')
+                counts = np.bincount(collisions.matid, minlength = len(materials.materials))
+                ends = np.cumsum(counts)
+                for matid in np.flatnonzero(counts):
+                    material = materials.materials[matid]
+                    if material is None:
+                        continue
+                    group = order[ends[matid] - counts[matid]:ends[matid]]
+                    if getattr(material, 'needsUV', True):
+                        u, v = collisions.uv(group)
+                    else:
+                        u = v = np.zeros(len(group), dtype = frac_reflective.dtype)
+                    matte_component.put(group, material.getColor(u, v))
+                    np.put(frac_reflective, group, material.getReflectivity(u, v))
+        
+                sub_raster = matte_component
+                sub_raster *= lighting
+                sub_raster *= 1.0 - frac_reflective
+                layers.append((len(ray), np.flatnonzero(collision_mask), sub_raster, frac_reflective))
+        
+            # reflected rays replace the current ones for the next bounce
+            reflective_mask = (frac_reflective > 0.0)
+            if depth == bounce or not reflective_mask.any():
+                break
+        
+            with profiledBlock('reflection', np.count_nonzero(reflective_mask)):
+                position_set = collisions.incd.extract(reflective_mask)
+                incident_set = ray.v.extract(collision_mask).extract(reflective_mask)
+                normal_set = collisions.norm.extract(reflective_mask)
+                projection = incident_set.dot(normal_set)
+                projection *= -2
+                reflected_set = normal_set.unit(out = normal_set)
+                reflected_set *= projection
+                reflected_set += incident_set
+                ray = Ray(position_set, reflected_set)
+                pixels = np.extract(reflective_mask, pixels)
+    
+    # the colors are folded back to front, every bounce adds the clipped
+    # color of the rays it reflected to its matte color and is clipped in
+    # turn, so that a bright reflection saturates where it is seen
+    raster = None
+    for count, hits, sub_raster, frac_reflective in reversed(layers):
+        if raster is not None:
+            reflective = np.flatnonzero(frac_reflective > 0.0)
+            raster *= np.take(frac_reflective, reflective)
+            raster += sub_raster.take(reflective)
+            sub_raster.put(reflective, raster)
+        raster = V3(0, 0, 0).repeat(count)
+        raster.put(hits, sub_raster.clip(0, 1))
     
-    materials = {hash(key): scene['materials'][key] for key in scene['materials']}
-    
-    all_collisions = collide(area, ray, scene)
-    collision_mask = (all_collisions.incd.x != np.inf)
-    sub_area = np.sum(collision_mask)
-    collisions = all_collisions.extract(collision_mask)
-    
-    # lighting and texturing
-    
-    lighting = V3(0, 0, 0).repeat(sub_area)
-    for light in scene['lighting']:
-        lighting += light.illuminate(scene, collisions)
-    
-    matte_component = V3(0, 0, 0).repeat(sub_area)
-    reflective_component = V3(0, 0, 0).repeat(sub_area)
-    
-    frac_reflective = np.repeat([0.0], sub_area)
-    for material_hash in materials:
-        mask = (collisions.mathash == material_hash)
-        material = materials[material_hash]
-        u = np.extract(mask, collisions.u)
-        v = np.extract(mask, collisions.v)
-        matte_component.place(mask, material.getColor(u, v))
-        np.place(frac_reflective, mask, material.getReflectivity(u, v))
-    
-    reflective_mask = (frac_reflective > 0.0)
-    if bounce > 0 and reflective_mask.any():
-        position_set = collisions.incd.extract(reflective_mask)
-        incident_set = ray.v.extract(reflective_mask)
-        normal_set = collisions.norm.extract(reflective_mask)
-        reflected_set = incident_set - normal_set.unit() * incident_set.dot(normal_set) * 2
-        reflective_camera = CameraPrecomputed(Ray(position_set, reflected_set))
-        reflective_component_set = render(reflective_camera, scene, bounce - 1)
-        reflective_component.place(reflective_mask, reflective_component_set)
-    
-    sub_raster = V3(0, 0, 0).repeat(np.sum(collision_mask))
-    sub_raster += matte_component * lighting * (1.0 - frac_reflective)
-    sub_raster += reflective_component * frac_reflective
-    
-    raster = V3(0, 0, 0).repeat(area)
-    raster.place(collision_mask, sub_raster)
-    
-    return raster.clip(0, 1)
\ No newline at end of file
+    return raster
\ No newline at end of file
@@ -0,0 +1,69 @@
+from .bvh import *
+from .material import *
+from .tree import *
+
+
+class Scene:
+    
+    def __init__(self, objects, materials = None, lighting = None, optimize = True):
+        self.objects = list(objects)
+        self.materials = dict(materials or {})
+        self.lighting = list(lighting or [])
+        self.optimize = optimize
+        self.compile()
+    
+    def compile(self):
+        for obj in self.objects:
+            if not hasattr(obj, 'intersectInto'):
+                raise ValueError('Scene objects must be geometry, got %r.' % (obj,))
+        for key in self.materials:
+            material = self.materials[key]
+            if not (hasattr(material, 'getColor') and hasattr(material, 'getReflectivity')):
+                raise ValueError('Material %r has no getColor or getReflectivity.' % (key,))
+        for light in self.lighting:
+            if not hasattr(light, 'illuminate'):
+                raise ValueError('Lights must have an illuminate method, got %r.' % (light,))
+        
+        # the renderer traces copies of the object trees in which chains of
+        # transformations are fused and CSG subtrees that can never be hit are
+        # pruned; material ids and bounds are stored on the copies, so that
+        # the objects given are left untouched and can be shared by scenes
+        copies = {}
+        self.traced = [obj.tracedCopy(copies) for obj in self.objects]
+        if self.optimize:
+            self.traced = [obj.optimized() for obj in self.traced]
+        
+        # bounds and costs are cached bottom up, deep trees are never recursed;
+        # tracing does recurse through the nodes of the copies, in which CSG
+        # nodes alternating with transformations are merged, see tracedCopy;
+        # nesting of CSG nodes of different kinds is traced as given
+        for obj in self.traced:
+            for node in postorder(obj):
+                node.bounds()
+                node.cost()
+        self.materialtable = MaterialTable(self.traced, self.materials)
+        self.bvh = BVH(self.traced)
+    
+    def update(self):
+        # objects changed in place, e.g. between the frames of an animation
+        self.compile()
+    
+    def __getitem__(self, key):
+        # read access in the style of the scene dictionaries
+        if key not in ('objects', 'materials', 'lighting'):
+            raise KeyError(key)
+        return getattr(self, key)
+
+
+def compileScene(scene):
+    if isinstance(scene, Scene):
+        return scene
+    
+    # scene dictionaries are read again on every call, so that objects changed
+    # in place between renders are seen; a Scene keeps its compiled form
+    # until update() is called
+    return Scene(scene['objects'], scene.get('materials', {}), scene.get('lighting', []))
+
+
+def sceneMaterials(scene):
+    return compileScene(scene).materialtable
@@ -1,6 +1,7 @@
 import numpy as np
 
 from .vector import *
+from .vector import _packed, _v3
 
 
 class TranslationHelper:
@@ -8,6 +9,14 @@ class TranslationHelper:
     def __init__(self, delta):
         self.delta = delta
     
+    def prepare(self):
+        pass
+    
+    def toMatrix(self):
+        matrix = np.identity(4)
+        matrix[:3, 3] = [self.delta.x[0], self.delta.y[0], self.delta.z[0]]
+        return matrix
+    
     def inverse(self):
         return TranslationHelper(self.delta * -1.0)
     
@@ -28,16 +37,21 @@ class ScalingHelper:
             self.factor = factor
         else:
             self.factor = V3(factor, factor, factor)
+        self.prepare()
     
-    def inverse(self):
-        return ScalingHelper(
-            V3(
-                1.0 / self.factor.x,
-                1.0 / self.factor.y,
-                1.0 / self.factor.z
-            )
+    def prepare(self):
+        self.inverseFactor = V3(
+            1.0 / self.factor.x,
+            1.0 / self.factor.y,
+            1.0 / self.factor.z
         )
     
+    def toMatrix(self):
+        return np.diag([self.factor.x[0], self.factor.y[0], self.factor.z[0], 1.0])
+    
+    def inverse(self):
+        return ScalingHelper(self.inverseFactor)
+    
     def apply(self, v):
         return self.factor * v
     
@@ -45,7 +59,7 @@ class ScalingHelper:
         return self.apply(v)
     
     def applyToNormal(self, v):
-        return self.inverse().apply(v).unit()
+        return (self.inverseFactor * v).unit()
 
 
 class RotationHelper:
@@ -53,13 +67,31 @@ class RotationHelper:
     def __init__(self, axisIndex, angle):
         self.axisIndex = axisIndex
         self.angle = angle
+        self.prepare()
+    
+    def prepare(self):
+        if self.axisIndex not in (0, 1, 2):
+            raise ValueError('Error: rotation axis index must be 0, 1, or 2')
+        self.c = float(np.cos(self.angle))
+        self.s = float(np.sin(self.angle))
+    
+    def toMatrix(self):
+        matrix = np.identity(4)
+        a, b = [axis for axis in range(3) if axis != self.axisIndex]
+        if self.axisIndex == 1:
+            a, b = b, a
+        matrix[a, a] = self.c
+        matrix[a, b] = -self.s
+        matrix[b, a] = self.s
+        matrix[b, b] = self.c
+        return matrix
     
     def inverse(self):
         return RotationHelper(self.axisIndex, self.angle * -1.0)
     
     def apply(self, v):
-        c = np.cos(self.angle)
-        s = np.sin(self.angle)
+        c = self.c
+        s = self.s
         if self.axisIndex == 0:
             return V3(
                 v.x,
@@ -86,3 +118,77 @@ class RotationHelper:
     
     def applyToNormal(self, v):
         return self.apply(v)
+
+
+def normalMatrix(inverse):
+    # normals transform with the inverse transpose of the linear part; inverse
+    # is the inverse 4x4 matrix or a stack of them
+    return np.swapaxes(inverse[..., :3, :3], -1, -2).copy()
+
+
+class AffineTransform:
+    
+    def __init__(self, matrix):
+        self.matrix = np.array(matrix, dtype = np.float64)
+        if self.matrix.shape != (4, 4):
+            raise ValueError('Affine transforms take a 4x4 matrix.')
+        self.prepare()
+    
+    def prepare(self):
+        self.inverseMatrix = np.linalg.inv(self.matrix)
+        self.normalMatrix = normalMatrix(self.inverseMatrix)
+    
+    def toMatrix(self):
+        return self.matrix
+    
+    def inverse(self):
+        return AffineTransform(self.inverseMatrix)
+    
+    def then(self, other):
+        # this transform followed by other, as one matrix
+        return AffineTransform(other.toMatrix() @ self.matrix)
+    
+    def multiply(self, matrix, v, offset = None):
+        if isinstance(v, PackedV3):
+            # one matrix product over the packed (n, 3) rows
+            data = v.data @ matrix.T.astype(v.data.dtype)
+            if offset is not None:
+                data += offset.astype(v.data.dtype)
+            return _packed(data)
+        
+        rows = matrix.tolist()
+        result = []
+        for i in range(3):
+            row = rows[i]
+            component = row[0] * v.x
+            component += row[1] * v.y
+            component += row[2] * v.z
+            if offset is not None:
+                component += float(offset[i])
+            result.append(component)
+        return _v3(*result)
+    
+    def apply(self, v):
+        return self.multiply(self.matrix[:3, :3], v, self.matrix[:3, 3])
+    
+    def applyToDifference(self, v):
+        return self.multiply(self.matrix[:3, :3], v)
+    
+    def applyToNormal(self, v):
+        return self.multiply(self.normalMatrix, v).unit()
+
+
+def axisRotation(axis, angle):
+    # rotation by angle around an arbitrary axis through the origin
+    k = axis.unit()
+    kx, ky, kz = k.x[0], k.y[0], k.z[0]
+    c = np.cos(angle)
+    s = np.sin(angle)
+    cross = np.array([
+        [0, -kz, ky],
+        [kz, 0, -kx],
+        [-ky, kx, 0]
+    ])
+    matrix = np.identity(4)
+    matrix[:3, :3] = c * np.identity(3) + s * cross + (1 - c) * np.outer([kx, ky, kz], [kx, ky, kz])
+    return AffineTransform(matrix)
\ No newline at end of file
@@ -0,0 +1,27 @@
+def postorder(root):
+    # every node of a tree once, children before their parents, without
+    # recursion so that generated trees of any depth can be walked
+    seen = set()
+    order = []
+    stack = [(root, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if expanded:
+            order.append(node)
+        elif id(node) not in seen:
+            seen.add(id(node))
+            stack.append((node, True))
+            stack.extend((child, False) for child in reversed(node.children()))
+    return order
+
+
+def rewrite(root, rule, results = None):
+    # rebuilds a tree bottom up, rule maps a node and its rebuilt children to
+    # the new node; results passed along for several trees keeps subtrees
+    # shared between them shared after the rewrite
+    if results is None:
+        results = {}
+    for node in postorder(root):
+        if id(node) not in results:
+            results[id(node)] = rule(node, [results[id(child)] for child in node.children()])
+    return results[id(root)]
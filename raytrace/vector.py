@@ -1,11 +1,65 @@
 import numpy as np
+from contextlib import contextmanager
+
+
+_precision = {'dtype': np.float64}
+_layout = {'name': 'planar'}
+
+
+def getPrecision():
+    return _precision['dtype']
+
+
+def setPrecision(dtype):
+    _precision['dtype'] = np.dtype(dtype).type
+
+
+@contextmanager
+def precision(dtype):
+    # floating point type of every V3 created inside the block
+    previous = getPrecision()
+    setPrecision(dtype)
+    try:
+        yield
+    finally:
+        setPrecision(previous)
+
+
+def getLayout():
+    return _layout['name']
+
+
+def setLayout(name):
+    if name not in ('planar', 'packed'):
+        raise ValueError('V3 layout must be planar or packed.')
+    _layout['name'] = name
+
+
+@contextmanager
+def layout(name):
+    # storage of every V3 created inside the block
+    previous = getLayout()
+    setLayout(name)
+    try:
+        yield
+    finally:
+        setLayout(previous)
+
 
 class V3:
     
-    def __init__(self, x, y, z):
-        xx = np.array(x, dtype = np.float64)
-        yy = np.array(y, dtype = np.float64)
-        zz = np.array(z, dtype = np.float64)
+    def __new__(cls, *args, **kwargs):
+        # pickle and copy call __new__ without arguments and then restore the
+        # state of the original class, so only constructor calls are redirected
+        if cls is V3 and (args or kwargs) and _layout['name'] == 'packed':
+            cls = PackedV3
+        return super().__new__(cls)
+    
+    def __init__(self, x, y, z, dtype = None):
+        dtype = dtype or getPrecision()
+        xx = np.array(x, dtype = dtype)
+        yy = np.array(y, dtype = dtype)
+        zz = np.array(z, dtype = dtype)
         
         if xx.shape != yy.shape or xx.shape != zz.shape:
             raise ValueError('Dimension mismatch.')
@@ -49,28 +103,76 @@ class V3:
             return False
     
     def __add__(self, other):
-        return V3(self.x + other.x, self.y + other.y, self.z + other.z)
+        return _v3(self.x + other.x, self.y + other.y, self.z + other.z)
         
     def __sub__(self, other):
-        return V3(self.x - other.x, self.y - other.y, self.z - other.z)
+        return _v3(self.x - other.x, self.y - other.y, self.z - other.z)
         
     def __mul__(self, other):
         if isinstance(other, V3):
-            return V3(self.x * other.x, self.y * other.y, self.z * other.z)
+            return _v3(self.x * other.x, self.y * other.y, self.z * other.z)
         else:
-            return V3(self.x * other, self.y * other, self.z * other)
+            return _v3(self.x * other, self.y * other, self.z * other)
     
     def __truediv__(self, other):
         if isinstance(other, V3):
-            return V3(self.x / other.x, self.y / other.y, self.z / other.z)
+            return _v3(self.x / other.x, self.y / other.y, self.z / other.z)
         else:
-            return V3(self.x / other, self.y / other, self.z / other)
+            return _v3(self.x / other, self.y / other, self.z / other)
     
-    def scale(self, scalar):
-        return V3(scalar * self.x, scalar * self.y, scalar * self.z)
+    # in-place operators write into the existing component arrays, so the
+    # right hand side has to broadcast to the length of this vector
         
-    def dot(self, other):
-        return self.x * other.x + self.y * other.y + self.z * other.z
+    def __iadd__(self, other):
+        np.add(self.x, other.x, out = self.x)
+        np.add(self.y, other.y, out = self.y)
+        np.add(self.z, other.z, out = self.z)
+        return self
+    
+    def __isub__(self, other):
+        np.subtract(self.x, other.x, out = self.x)
+        np.subtract(self.y, other.y, out = self.y)
+        np.subtract(self.z, other.z, out = self.z)
+        return self
+    
+    def __imul__(self, other):
+        if isinstance(other, V3):
+            np.multiply(self.x, other.x, out = self.x)
+            np.multiply(self.y, other.y, out = self.y)
+            np.multiply(self.z, other.z, out = self.z)
+        else:
+            np.multiply(self.x, other, out = self.x)
+            np.multiply(self.y, other, out = self.y)
+            np.multiply(self.z, other, out = self.z)
+        return self
+    
+    def __itruediv__(self, other):
+        if isinstance(other, V3):
+            np.divide(self.x, other.x, out = self.x)
+            np.divide(self.y, other.y, out = self.y)
+            np.divide(self.z, other.z, out = self.z)
+        else:
+            np.divide(self.x, other, out = self.x)
+            np.divide(self.y, other, out = self.y)
+            np.divide(self.z, other, out = self.z)
+        return self
+    
+    def scale(self, scalar, out = None):
+        if out is None:
+            return _v3(scalar * self.x, scalar * self.y, scalar * self.z)
+        np.multiply(scalar, self.x, out = out.x)
+        np.multiply(scalar, self.y, out = out.y)
+        np.multiply(scalar, self.z, out = out.z)
+        return out
+        
+    def dot(self, other, out = None):
+        if out is None:
+            return self.x * other.x + self.y * other.y + self.z * other.z
+        tmp = self.y * other.y
+        np.multiply(self.x, other.x, out = out)
+        np.add(out, tmp, out = out)
+        np.multiply(self.z, other.z, out = tmp)
+        return np.add(out, tmp, out = out)
     
     def normsq(self):
         return self.dot(self)
@@ -78,21 +180,26 @@ class V3:
     def norm(self):
         return np.sqrt(self.normsq())
         
-    def unit(self):
-        return self.scale(1/self.norm())
+    def unit(self, out = None):
+        return self.scale(1/self.norm(), out)
         
-    def cross(self, other):
-        return V3(
-            self.y * other.z - self.z * other.y,
-            self.z * other.x - self.x * other.z,
-            self.x * other.y - self.y * other.x,
-        )
+    def cross(self, other, out = None):
+        x = self.y * other.z - self.z * other.y
+        y = self.z * other.x - self.x * other.z
+        z = self.x * other.y - self.y * other.x
+        if out is None:
+            return _v3(x, y, z)
+        # out may be one of the operands, so it is only written at the end
+        np.copyto(out.x, x)
+        np.copyto(out.y, y)
+        np.copyto(out.z, z)
+        return out
         
     def mapToXYZ(self, f):
         return V3(f(self.x), f(self.y), f(self.z))
     
     def extract(self, mask):
-        return V3(
+        return _v3(
             np.extract(mask, self.x),
             np.extract(mask, self.y),
             np.extract(mask, self.z)
@@ -103,37 +210,207 @@ class V3:
         np.place(self.y, mask, other.y)
         np.place(self.z, mask, other.z)
     
+    def take(self, indices):
+        return _v3(
+            np.take(self.x, indices),
+            np.take(self.y, indices),
+            np.take(self.z, indices)
+        )
+    
+    def put(self, indices, other):
+        np.put(self.x, indices, other.x)
+        np.put(self.y, indices, other.y)
+        np.put(self.z, indices, other.z)
+    
     def copyfrom(self, src, casting='same_kind', where=True):
         np.copyto(self.x, src.x, casting, where)
         np.copyto(self.y, src.y, casting, where)
         np.copyto(self.z, src.z, casting, where)
     
     def repeat(self, n):
-        return V3(
+        return _v3(
             np.repeat(self.x, n),
             np.repeat(self.y, n),
             np.repeat(self.z, n)
         )
     
     def where(self, use_first, other):
-        return V3(
+        return _v3(
             np.where(use_first, self.x, other.x),
             np.where(use_first, self.y, other.y),
             np.where(use_first, self.z, other.z)
         )
     
     def clip(self, mn, mx):
-        return V3(
+        return _v3(
             np.clip(self.x, mn, mx),
             np.clip(self.y, mn, mx),
             np.clip(self.z, mn, mx)
         )
 
 
+def _v3(x, y, z):
+    # internal constructor for component arrays produced by numpy operations
+    # on V3s, which already have matching 1d shapes
+    if _layout['name'] == 'packed':
+        return V3(x, y, z)
+    dtype = _precision['dtype']
+    result = object.__new__(V3)
+    result.x = x if x.dtype == dtype else x.astype(dtype)
+    result.y = y if y.dtype == dtype else y.astype(dtype)
+    result.z = z if z.dtype == dtype else z.astype(dtype)
+    return result
+
+
+def _column(a):
+    a = np.asarray(a)
+    return a[:, np.newaxis] if a.ndim == 1 else a
+
+
+def _packed(data):
+    # as _v3, for (n, 3) arrays; python scalars taken through _column are
+    # float64 arrays, which promote the result under NumPy 2
+    dtype = _precision['dtype']
+    result = object.__new__(PackedV3)
+    result.setData(data if data.dtype == dtype else data.astype(dtype))
+    return result
+
+
+class PackedV3(V3):
+    
+    # x, y and z are views into the columns of one contiguous (n, 3) array
+    
+    def __init__(self, x, y, z, dtype = None):
+        super().__init__(x, y, z, dtype)
+        self.setData(np.stack([self.x, self.y, self.z], axis = 1))
+    
+    def setData(self, data):
+        self.data = data
+        self.x = data[:, 0]
+        self.y = data[:, 1]
+        self.z = data[:, 2]
+    
+    def __getstate__(self):
+        return self.data
+    
+    def __setstate__(self, data):
+        self.setData(data)
+    
+    def __add__(self, other):
+        if isinstance(other, PackedV3):
+            return _packed(self.data + other.data)
+        return super().__add__(other)
+    
+    def __iadd__(self, other):
+        if isinstance(other, PackedV3):
+            np.add(self.data, other.data, out = self.data)
+            return self
+        return super().__iadd__(other)
+    
+    def __sub__(self, other):
+        if isinstance(other, PackedV3):
+            return _packed(self.data - other.data)
+        return super().__sub__(other)
+    
+    def __isub__(self, other):
+        if isinstance(other, PackedV3):
+            np.subtract(self.data, other.data, out = self.data)
+            return self
+        return super().__isub__(other)
+    
+    def __imul__(self, other):
+        if isinstance(other, PackedV3):
+            np.multiply(self.data, other.data, out = self.data)
+        elif isinstance(other, V3):
+            return super().__imul__(other)
+        else:
+            np.multiply(self.data, _column(other), out = self.data)
+        return self
+    
+    def __mul__(self, other):
+        if isinstance(other, PackedV3):
+            return _packed(self.data * other.data)
+        elif isinstance(other, V3):
+            return super().__mul__(other)
+        else:
+            return _packed(self.data * _column(other))
+    
+    def __truediv__(self, other):
+        if isinstance(other, PackedV3):
+            return _packed(self.data / other.data)
+        elif isinstance(other, V3):
+            return super().__truediv__(other)
+        else:
+            return _packed(self.data / _column(other))
+    
+    def scale(self, scalar, out = None):
+        if isinstance(out, PackedV3):
+            np.multiply(_column(scalar), self.data, out = out.data)
+            return out
+        elif out is not None:
+            return super().scale(scalar, out)
+        return _packed(_column(scalar) * self.data)
+    
+    def dot(self, other, out = None):
+        if out is not None:
+            return super().dot(other, out)
+        if isinstance(other, PackedV3):
+            # a single vector against many is a matrix-vector product
+            if len(other.data) == 1:
+                return self.data @ other.data[0]
+            if len(self.data) == 1:
+                return other.data @ self.data[0]
+            return np.einsum('ij,ij->i', self.data, other.data)
+        return super().dot(other)
+    
+    def cross(self, other, out = None):
+        if isinstance(other, PackedV3):
+            if out is None:
+                return _packed(np.cross(self.data, other.data))
+            out.copyfrom(_packed(np.cross(self.data, other.data)))
+            return out
+        return super().cross(other, out)
+    
+    def extract(self, mask):
+        return _packed(np.compress(mask, self.data, axis = 0))
+    
+    def place(self, mask, other):
+        if isinstance(other, PackedV3):
+            self.data[np.asarray(mask, dtype = bool)] = other.data
+        else:
+            super().place(mask, other)
+    
+    def take(self, indices):
+        return _packed(np.take(self.data, indices, axis = 0))
+    
+    def put(self, indices, other):
+        if isinstance(other, PackedV3):
+            self.data[indices] = other.data
+        else:
+            super().put(indices, other)
+    
+    def copyfrom(self, src, casting='same_kind', where=True):
+        if isinstance(src, PackedV3):
+            np.copyto(self.data, src.data, casting, _column(where))
+        else:
+            super().copyfrom(src, casting, where)
+    
+    def repeat(self, n):
+        return _packed(np.repeat(self.data, n, axis = 0))
+    
+    def where(self, use_first, other):
+        if isinstance(other, PackedV3):
+            return _packed(np.where(_column(use_first), self.data, other.data))
+        return super().where(use_first, other)
+    
+    def clip(self, mn, mx):
+        return _packed(np.clip(self.data, mn, mx))
+
+
 class Ray:
-    def __init__(self, r, v):
+    def __init__(self, r, v, normalize = True):
         self.r = r
-        self.v = v.unit()
+        self.v = v.unit() if normalize else v
     def __len__(self):
         return len(self.r)
     def trace(self, dist):
@@ -141,10 +418,18 @@ class Ray:
     def extract(self, mask):
         return Ray(
             self.r.extract(mask),
-            self.v.extract(mask)
+            self.v.extract(mask),
+            normalize = False
+        )
+    def take(self, indices):
+        return Ray(
+            self.r.take(indices),
+            self.v.take(indices),
+            normalize = False
         )
     def transform(self, transform):
         return Ray(
             transform.apply(self.r),
-            transform.apply(self.v).unit()
+            transform.applyToDifference(self.v).unit(),
+            normalize = False
         )
@@ -1,6 +1,8 @@
 import unittest
+from testbounds import *
 from testgeometry import *
 from testrender import *
+from testscene import *
 from testtransform import *
 from testvector import *
 
@@ -0,0 +1,92 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+from raytrace import *
+import unittest
+
+
+class TestAABB(unittest.TestCase):
+    
+    def setUp(self):
+        self.box = AABB(V3(-1, -1, -1), V3(1, 2, 3))
+    
+    def test_hit(self):
+        ray = Ray(
+            V3(
+                np.array([-5, -5, 0, 0, 5]),
+                np.array([0, 5, 0, 1, 0]),
+                np.array([0, 0, 0, 1, 0])
+            ),
+            V3(
+                np.array([1, 1, 0, 1, 1]),
+                np.array([0, 0, 0, 0, 0]),
+                np.array([0, 0, 1, 0, 0])
+            )
+        )
+        self.assertTrue((self.box.hit(ray) == np.array([True, False, True, True, False])).all())
+        self.assertTrue((self.box.contains(ray.r) == np.array([False, False, True, True, False])).all())
+    
+    def test_union_intersection(self):
+        other = AABB(V3(0, 0, 0), V3(4, 4, 4))
+        union = self.box.union(other)
+        self.assertTrue(union.lo.allEqual(V3(-1, -1, -1)))
+        self.assertTrue(union.hi.allEqual(V3(4, 4, 4)))
+        intersection = self.box.intersection(other)
+        self.assertTrue(intersection.lo.allEqual(V3(0, 0, 0)))
+        self.assertTrue(intersection.hi.allEqual(V3(1, 2, 3)))
+        self.assertTrue(self.box.intersection(AABB(V3(5, 5, 5), V3(6, 6, 6))).isEmpty())
+        self.assertFalse(unboundedBox().isFinite())
+        self.assertTrue(emptyBox().isEmpty())
+    
+    def test_geometry_bounds(self):
+        sphere = Sphere(V3(1, 2, 3), 2)
+        self.assertTrue(sphere.bounds().lo.allEqual(V3(-1, 0, 1)))
+        self.assertTrue(sphere.bounds().hi.allEqual(V3(3, 4, 5)))
+        
+        translated = Translation(V3(1, 0, 0), sphere).bounds()
+        self.assertTrue(translated.lo.allEqual(V3(0, 0, 1)))
+        self.assertTrue(translated.hi.allEqual(V3(4, 4, 5)))
+        
+        scaled = Scaling(V3(2, -1, 1), sphere).bounds()
+        self.assertTrue(scaled.lo.allEqual(V3(-2, -4, 1)))
+        self.assertTrue(scaled.hi.allEqual(V3(6, 0, 5)))
+        
+        self.assertFalse(Ground(V3(0, 0, 0), V3(0, 0, 1)).bounds().isFinite())
+        self.assertTrue(Intersection(
+            Sphere(V3(0, 0, 0), 1),
+            Sphere(V3(5, 0, 0), 1)
+        ).bounds().isEmpty())
+
+
+class TestBVH(unittest.TestCase):
+    
+    def test_collide(self):
+        rng = np.random.default_rng(0)
+        objects = [
+            Sphere(V3(*rng.uniform(-5, 5, 3)), rng.uniform(0.1, 1.0), material = i)
+            for i in range(50)
+        ]
+        objects.append(Ground(V3(0, 0, -6), V3(0, 0, 1), material = 'ground'))
+        objects.append(Translation(V3(0, 1, 0), Sphere(V3(0, 0, 0), 1, material = 'moved')))
+        MaterialTable(objects, {})
+        
+        ray = Ray(
+            V3(*rng.uniform(-8, 8, (3, 500))),
+            V3(*rng.normal(size = (3, 500)))
+        )
+        
+        expected = CollisionResult(len(ray))
+        for obj in objects:
+            expected.takeNearer(obj.intersections(ray))
+        
+        collisions = CollisionResult(len(ray))
+        BVH(objects).collide(ray, collisions)
+        
+        self.assertTrue(collisions.incd.allEqual(expected.incd))
+        self.assertTrue((collisions.matid == expected.matid).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
\ No newline at end of file
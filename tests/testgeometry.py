@@ -40,6 +40,31 @@ class TestGeometry(unittest.TestCase):
             self.assertEqual(type(collisions.incd), V3)
             self.assertEqual(type(collisions.norm), V3)
     
+    def test_many_members(self):
+        # a ray passes through an intersection of spheres where it has entered
+        # all of them and left none
+        rng = np.random.default_rng(0)
+        centers = rng.uniform(-0.3, 0.3, size = (200, 3)) + [4, 0, 0]
+        intersection = Intersection(*[Sphere(V3(*center), 1) for center in centers])
+        
+        n = 400
+        directions = np.stack([np.ones(n), rng.uniform(-0.2, 0.2, n), rng.uniform(-0.2, 0.2, n)])
+        directions /= np.sqrt((directions ** 2).sum(axis = 0))
+        ray = Ray(V3(np.zeros(n), np.zeros(n), np.zeros(n)), V3(*directions))
+        b = centers @ directions
+        # misses have no root and are never entered
+        discriminant = b ** 2 - (centers ** 2).sum(axis = 1)[:, np.newaxis] + 1
+        root = np.sqrt(np.maximum(discriminant, 0))
+        entry = np.where(discriminant < 0, np.inf, b - root).max(axis = 0)
+        exit = (b + root).min(axis = 0)
+        expected = np.where(entry < exit, entry, np.inf)
+        self.assertTrue(np.isfinite(expected).any() and not np.isfinite(expected).all())
+        self.assertTrue(np.allclose(intersection.intersections(ray).t, expected))
+        
+        inside = np.isfinite(expected)
+        self.assertTrue(intersection.interior(ray.trace(expected + 0.001).extract(inside)).all())
+        self.assertFalse(intersection.interior(ray.trace(expected - 0.001).extract(inside)).any())
+    
     def test_interior(self):
         for geom in self.geoms:
             result = geom.interior(V3(0, 0, 0))
@@ -84,5 +109,159 @@ class TestGeometry(unittest.TestCase):
         self.assertFalse(sphere.interior(V3(110, 110, -100)).any())
         self.assertTrue(sphere.interior(V3(103, 103, -103)).all())
 
+    def test_culling(self):
+        rng = np.random.default_rng(0)
+        ray = Ray(
+            V3(*rng.uniform(-4, 4, (3, 200))),
+            V3(*rng.normal(size = (3, 200)))
+        )
+        for geom in self.geoms:
+            if isinstance(geom, Composite):
+                for invert in [False, True]:
+                    self.assertTrue(geom.intersections(ray, invert).incd.allEqual(
+                        geom.combine(ray, invert).incd
+                    ))
+    
+    def test_translation(self):
+        translation = Translation(V3(0, 5, 0), Sphere(V3(0, 0, 0), 1))
+        collisions = translation.intersections(Ray(V3(-10, 5, 0), V3(1, 0, 0)))
+        self.assertTrue(collisions.incd.allEqual(V3(-1, 5, 0)))
+        self.assertTrue(collisions.norm.allEqual(V3(-1, 0, 0)))
+
+    def test_misses(self):
+        # misses are not transformed, their infinite points would turn into nan
+        rotation = Rotation(V3(0, 0, 1), 0.1, Translation(V3(5, 0, 0), Sphere(V3(0, 0, 0), 1)))
+        ray = Ray(V3(0, 0, 0).repeat(2), V3(np.array([1, 0]), np.array([0, 1]), np.array([0, 0])))
+        with np.errstate(all = 'raise'):
+            collisions = rotation.intersections(ray)
+        self.assertTrue(np.isfinite(collisions.t[0]))
+        self.assertTrue(collisions.incd.take([1]).allEqual(V3(np.inf, np.inf, np.inf)))
+
+    def test_members(self):
+        # the material of a CSG node is keyword-only
+        a = Sphere(V3(0, 0, 0), 1)
+        for operation in [Union, Intersection, Difference]:
+            self.assertRaisesRegex(TypeError, 'keyword-only', operation, a, a, 'red')
+            self.assertEqual(operation(a, a, material = 'red').material, 'red')
+        self.assertRaises(TypeError, Intersection)
+        self.assertRaises(TypeError, Difference)
+        self.assertIsInstance(Union().optimized(), Empty)
+
+    def test_flattened(self):
+        sphere = Sphere(V3(1, 0, 0), 1, material = 'inner')
+        chain = Translation(
+            V3(0, 5, 0),
+            Rotation(V3(1, 1, 0), 0.5, Scaling(V3(2, 1, 1), sphere, material = 'scaled'))
+        )
+        flat = chain.flattened()
+        self.assertIsInstance(flat, Affine)
+        self.assertIs(flat.obj, sphere)
+        self.assertEqual(flat.material, 'scaled')
+        
+        union = Union(chain, Sphere(V3(0, 0, 0), 1))
+        self.assertIs(union.flattened().objects[1], union.objects[1])
+        self.assertIsNot(union.flattened().objects[0], chain)
+        self.assertIs(union.objects[0], chain)
+        
+        rng = np.random.default_rng(0)
+        ray = Ray(
+            V3(*rng.uniform(-4, 4, (3, 200))) + V3(0, 5, 0),
+            V3(*rng.normal(size = (3, 200)))
+        )
+        for invert in [False, True]:
+            expected = chain.intersections(ray, invert)
+            collisions = flat.intersections(ray, invert)
+            self.assertTrue(np.allclose(collisions.t, expected.t))
+            self.assertTrue(np.allclose(collisions.norm.x, expected.norm.x))
+    
+    def test_kernels(self):
+        self.assertRaises(ValueError, setKernelBackend, 'unknown')
+        rng = np.random.default_rng(0)
+        ray = Ray(
+            V3(*rng.uniform(-4, 4, (3, 200))),
+            V3(*rng.normal(size = (3, 200)))
+        )
+        primitives = [Sphere(V3(0.5, 0, 0), 2), Ground(V3(0, 0, -1), V3(0.1, 0.2, 1))]
+        expected = [[p.intersections(ray, invert) for invert in [False, True]] for p in primitives]
+        for backend in kernelBackends():
+            with kernelBackend(backend):
+                for p, results in zip(primitives, expected):
+                    for invert, result in zip([False, True], results):
+                        collisions = p.intersections(ray, invert)
+                        self.assertTrue(np.allclose(collisions.t, result.t))
+                        self.assertTrue(np.allclose(collisions.norm.x, result.norm.x))
+        self.assertEqual(getKernelBackend(), 'numpy')
+
+    def test_optimized(self):
+        a = Sphere(V3(0, 0, 0), 1)
+        b = Sphere(V3(0, 3, 0), 1)
+        tree = Union(
+            Union(a, Intersection(b, Sphere(V3(0, 6, 0), 1))),
+            Difference(b, Sphere(V3(5, 0, 0), 1), material = 'b')
+        )
+        optimized = tree.optimized()
+        self.assertIsInstance(optimized, Union)
+        self.assertIs(optimized.objects[0], a)
+        self.assertEqual(optimized.objects[1].objects, [b])
+        self.assertEqual(optimized.objects[1].material, 'b')
+        self.assertIsInstance(Intersection(a, Translation(V3(0, 6, 0), b)).optimized(), Empty)
+        
+        c = Sphere(V3(0.5, 0, 0), 1)
+        d = Sphere(V3(0, 0.5, 0), 1)
+        self.assertEqual(Difference(Difference(a, c), d).optimized().negatives, [c, d])
+        self.assertEqual(Intersection(Intersection(a, c), d).optimized().objects, [a, c, d])
+        
+        def csgTree(rng, depth):
+            if depth == 0:
+                return Sphere(V3(*rng.uniform(-3, 3, 3)), rng.uniform(0.5, 1.5))
+            operation = [Union, Intersection, Difference][rng.integers(3)]
+            return operation(csgTree(rng, depth - 1), csgTree(rng, depth - 1))
+        
+        rng = np.random.default_rng(0)
+        ray = Ray(
+            V3(*rng.uniform(-4, 4, (3, 200))),
+            V3(*rng.normal(size = (3, 200)))
+        )
+        for i in range(20):
+            tree = csgTree(rng, 4)
+            for invert in [False, True]:
+                expected = tree.intersections(ray, invert)
+                collisions = tree.optimized().intersections(ray, invert)
+                hit = expected.t != np.inf
+                self.assertTrue(np.array_equal(collisions.t, expected.t))
+                self.assertTrue(collisions.norm.extract(hit).allEqual(expected.norm.extract(hit)))
+
+    def test_instances(self):
+        prototype = Difference(Sphere(V3(0, 0, 0), 1), Sphere(V3(0.7, 0, 0), 0.5))
+        rng = np.random.default_rng(0)
+        transforms = [
+            axisRotation(V3(*rng.normal(size = 3)), rng.uniform(0, 6)).then(
+                TranslationHelper(V3(*rng.uniform(-4, 4, 3)))
+            )
+            for i in range(20)
+        ]
+        instances = Instances(prototype, transforms)
+        copies = Union(*[Affine(transform, prototype) for transform in transforms])
+        self.assertEqual(len(instances), 20)
+        self.assertRaises(ValueError, Instances, prototype, [np.identity(3)])
+        
+        ray = Ray(
+            V3(*rng.uniform(-6, 6, (3, 500))),
+            V3(*rng.normal(size = (3, 500)))
+        )
+        for invert in [False, True]:
+            expected = copies.intersections(ray, invert)
+            collisions = instances.intersections(ray, invert)
+            hit = expected.t != np.inf
+            self.assertTrue(np.array_equal(collisions.t != np.inf, hit))
+            self.assertTrue(np.allclose(collisions.t[hit], expected.t[hit]))
+            self.assertTrue(np.allclose(collisions.norm.x[hit], expected.norm.x[hit]))
+        self.assertTrue(np.array_equal(instances.interior(ray.r), copies.interior(ray.r)))
+        
+        # a transformation of the prototype is folded into the matrices
+        moved = Instances(Translation(V3(1, 0, 0), prototype), transforms).flattened()
+        self.assertIs(moved.obj, prototype)
+        self.assertTrue(np.allclose(moved.matrices[:, :3, 3] - instances.matrices[:, :3, 3], instances.matrices[:, :3, 0]))
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
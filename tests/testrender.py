@@ -2,11 +2,33 @@ import os
 import sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+import multiprocessing
 import numpy as np
+import struct
+import tempfile
+import zlib
 from raytrace import *
 import unittest
 
 
+def sceneDict(*objects):
+    # the objects given over a ground, lit from above
+    return {
+        'objects': list(objects) + [
+            Ground(V3(0, 0, -1), V3(0, 0, 1), material = 'floor')
+        ],
+        'materials': {
+            'mat': UniformMaterial(V3(1.0, 0.5, 0.25)),
+            'floor': UniformMaterial(V3(1.0, 0.5, 0.25)),
+            'mirror': UniformMaterial(V3(0, 0, 0), reflectivity = 0.5)
+        },
+        'lighting': [
+            AmbientLight(0.5),
+            DirectionalLight(V3(1, 0, -1), 0.5)
+        ]
+    }
+
+
 class TestRender(unittest.TestCase):
     
     def assertAllEqual(self, a, b):
@@ -80,6 +102,467 @@ class TestRender(unittest.TestCase):
                 0.5 * 0.25 * np.array([0.0, 0.0, 0.0, 0.0, 1, 0.0, 0.0, 0.0, 0.0])
             )
         )
+    
+    def test_saturation(self):
+        # the overbright wall is clipped before the half reflecting mirror
+        # takes its share of it
+        camera = CameraOrthogonal(V3(0, 0, 0), V3(1, 0, 0), (1, 1), (1, 1))
+        
+        scene = {
+            'objects': [
+                Ground(V3(4, 0, 0), V3(-1, 0, 0), material = 'mirror'),
+                Ground(V3(-4, 0, 0), V3(1, 0, 0), material = 'wall')
+            ],
+            'materials': {
+                'wall': UniformMaterial(V3(1.0, 0.5, 0.125)),
+                'mirror': UniformMaterial(V3(0, 0, 0), reflectivity = 0.5)
+            },
+            'lighting': [
+                AmbientLight(4.0)
+            ]
+        }
+        
+        self.assertAllEqual(render(camera, scene, 1), V3(0.5, 0.5, 0.25).repeat(1))
+    
+    def test_collide(self):
+        scene = {
+            'objects': [
+                Sphere(V3(-5, 0, 0), 1, material = 'far'),
+                Scaling(2, Sphere(V3(4, 0, 0), 1, material = 'near'))
+            ]
+        }
+        
+        # the nearer hit along the ray is farther away from the world origin
+        collisions = collide(1, Ray(V3(20, 0, 0), V3(-1, 0, 0)), scene)
+        self.assertAllEqual(collisions.t, np.array([10.0]))
+        self.assertAllEqual(collisions.incd, V3(10, 0, 0))
+        self.assertAllEqual(collisions.matid, np.array([sceneMaterials(scene).id('near')]))
+    
+    def test_nearest(self):
+        # hits written in place into one result, for all rays or a subset of
+        # them, are the nearest of the hits of every primitive on its own
+        rng = np.random.default_rng(0)
+        spheres = [Sphere(V3(4 + 0.5 * k, 0.3 * k, 0), 1) for k in range(4)] + [Ground(V3(0, 0, -0.5), V3(0, 0, 1))]
+        for k, obj in enumerate(spheres):
+            obj.matid = k + 1
+        
+        n = 200
+        ray = Ray(V3(np.zeros(n), np.zeros(n), np.zeros(n)), V3(np.ones(n), rng.uniform(-0.5, 0.5, n), rng.uniform(-0.5, 0.5, n)))
+        subsets = [None, np.flatnonzero(rng.random(n) < 0.5), np.flatnonzero(rng.random(n) < 0.7), None, np.arange(0, n, 3)]
+        
+        nearest = CollisionResult(n)
+        expected = CollisionResult(n)
+        for obj, indices in zip(spheres, subsets):
+            if indices is None:
+                obj.intersectInto(ray, nearest)
+                collisions = obj.intersections(ray)
+            else:
+                obj.intersectInto(ray.take(indices), nearest, indices)
+                collisions = CollisionResult(n)
+                collisions.put(indices, obj.intersections(ray.take(indices)))
+                collisions.setMatId(obj.matid)
+            expected.takeNearer(collisions)
+        
+        t = np.array([
+            [np.inf if indices is not None and i not in indices else t for i, t in enumerate(obj.intersections(ray).t)]
+            for obj, indices in zip(spheres, subsets)
+        ])
+        self.assertTrue(np.isfinite(t).sum(axis = 0).max() > 2)
+        self.assertAllEqual(nearest.t, t.min(axis = 0))
+        hit = np.isfinite(nearest.t)
+        self.assertAllEqual(nearest.matid, np.where(hit, t.argmin(axis = 0) + 1, 0))
+        self.assertAllEqual(nearest.t, expected.t)
+        self.assertTrue(nearest.incd.extract(hit).allEqual(expected.incd.extract(hit)))
+        self.assertTrue(nearest.norm.extract(hit).allEqual(expected.norm.extract(hit)))
+        
+        # place writes the masked rows and leaves the others
+        mask = rng.random(n) < 0.5
+        result = CollisionResult(n)
+        result.place(mask, np.full(mask.sum(), 2.0), V3(1, 2, 3).repeat(mask.sum()), V3(0, 0, 1).repeat(mask.sum()))
+        self.assertAllEqual(result.t, np.where(mask, 2.0, np.inf))
+        self.assertAllEqual(result.incd.x, np.where(mask, 1.0, np.inf))
+        self.assertAllEqual(result.norm.z, np.where(mask, 1.0, 0.0))
+    
+    def test_occluded(self):
+        scene = {
+            'objects': [
+                Sphere(V3(5, 0, 0), 1),
+                Difference(Sphere(V3(0, 5, 0), 1), Sphere(V3(0, 5, 0), 0.5)),
+                Ground(V3(0, 0, -10), V3(0, 0, 1))
+            ]
+        }
+        ray = Ray(
+            V3(0, 0, 0).repeat(5),
+            V3(
+                np.array([1, 1, 0, 1, 0]),
+                np.array([0, 0, 1, 1, 0]),
+                np.array([0, 0, 0, 0, 1])
+            )
+        )
+        self.assertAllEqual(
+            occluded(ray, scene, np.array([10, 3, 10, 10, 10])),
+            np.array([True, False, True, False, False])
+        )
+        self.assertAllEqual(
+            occluded(ray, scene),
+            np.array([True, True, True, False, False])
+        )
+    
+    def test_uv(self):
+        sphere = Sphere(V3(0, 0, 0), 1, material = 'checkered')
+        scene = {
+            'objects': [
+                Translation(V3(5, 0, 0), sphere),
+                Sphere(V3(5, 3, 0), 1, material = 'plain')
+            ],
+            'materials': {
+                'checkered': CheckeredMaterial(
+                    UniformMaterial(V3(1, 1, 1)),
+                    UniformMaterial(V3(0, 0, 0)),
+                    scale = 0.25
+                ),
+                'plain': UniformMaterial(V3(1, 0, 0))
+            }
+        }
+        ray = Ray(V3(0, 0, 0).repeat(2), V3(np.array([1, 5]), np.array([0, 3]), np.array([0, 0])))
+        collisions = collide(len(ray), ray, scene)
+        
+        # texture coordinates come from the untransformed hit point
+        u, v = collisions.uv(np.flatnonzero(collisions.matid == sceneMaterials(scene).id('checkered')))
+        self.assertAllEqual(u, np.array([0.5]))
+        self.assertAllEqual(v, np.array([0.5]))
+        
+        # uniform materials never ask the primitive for texture coordinates
+        def fail(points, invert = False):
+            raise AssertionError('uv computed for a uniform material')
+        scene['objects'][1].uv = fail
+        scene['lighting'] = [AmbientLight(1.0)]
+        render(CameraPerspective(V3(0, 0, 0), V3(5, 3, 0), (0.1, 0.1), (4, 4)), scene)
+    
+    def test_materials(self):
+        inner = Sphere(V3(0, 0, 0), 1, material = 'b')
+        scene = {
+            'objects': [
+                Translation(V3(5, 0, 0), inner, material = 'unknown'),
+                Union(Sphere(V3(5, 3, 0), 1), Sphere(V3(5, -3, 0), 1, material = 'a'))
+            ],
+            'materials': {
+                'a': UniformMaterial(V3(1, 0, 0)),
+                'b': UniformMaterial(V3(0, 1, 0))
+            }
+        }
+        compiled = compileScene(scene)
+        table = compiled.materialtable
+        self.assertEqual([table.id(key) for key in ['a', 'b', 'c']], [1, 2, 0])
+        self.assertEqual(compiled.traced[0].obj.matid, 2)
+        self.assertEqual(compiled.traced[0].matid, 3)
+        self.assertIsNone(table.materials[3])
+        
+        # ids belong to the compiled scene, the objects given keep none and
+        # can be shared by scenes numbering their materials differently
+        self.assertEqual(inner.matid, 0)
+        camera = CameraOrthogonal(V3(-5, 0, 0), V3(1, 0, 0), (1, 1), (2, 2))
+        red = Scene([inner], {'red': UniformMaterial(V3(1, 0, 0)), 'b': UniformMaterial(V3(0, 0, 1))}, [AmbientLight(1.0)])
+        before = render(camera, red)
+        Scene([inner], {'b': UniformMaterial(V3(0, 0, 1)), 'red': UniformMaterial(V3(1, 0, 0))}, [AmbientLight(1.0)])
+        self.assertAllEqual(render(camera, red), before)
+        
+        scene['materials']['c'] = UniformMaterial(V3(0, 0, 1))
+        self.assertEqual(sceneMaterials(scene).id('c'), 3)
+    
+    def test_precision(self):
+        resolution = (24, 24)
+        origin = V3(0, -3, 0.5)
+        camera = CameraPerspective(origin, (V3(4, 0, 0) - origin).unit(), (1, 1), resolution)
+        
+        scene = {
+            'objects': [
+                Difference(
+                    Intersection(
+                        Sphere(V3(4, 0, 0), 1),
+                        Sphere(V3(4, -1, 0), 1),
+                        material = 'blue'
+                    ),
+                    Sphere(V3(4, -1, 0), 0.5, material = 'green')
+                ),
+                Sphere(V3(4, 3, 0.8), 0.5, material = 'mirror'),
+                Ground(V3(0, 0, -20), V3(0, 0, 1), material = 'checkered')
+            ],
+            'materials': {
+                'green': UniformMaterial(V3(0, 1, 0)),
+                'blue': UniformMaterial(V3(0, 0, 1)),
+                'checkered': CheckeredMaterial(
+                    UniformMaterial(V3(0.8, 0.8, 0.8)),
+                    UniformMaterial(V3(0, 0, 0)),
+                    scale = 10.0
+                ),
+                'mirror': UniformMaterial(V3(0, 0, 0), reflectivity = 1.0)
+            },
+            'lighting': [
+                AmbientLight(0.2),
+                DirectionalLight(V3(1, 1, -1)),
+                PointLight(V3(2, -2, 3), 5)
+            ]
+        }
+        
+        raster64 = render(camera, scene)
+        raster32 = render(camera, scene, dtype = np.float32)
+        
+        self.assertEqual(raster32.x.dtype, np.float32)
+        self.assertEqual(getPrecision(), np.float64)
+        
+        difference = np.abs(np.concatenate([
+            raster64.x - raster32.x,
+            raster64.y - raster32.y,
+            raster64.z - raster32.z
+        ]))
+        self.assertLess(difference.mean(), 1e-3)
+        self.assertLess(np.mean(difference > 1e-2), 0.01)
+    
+    def test_packed_precision(self):
+        # scalars applied to packed vectors keep the precision of the vectors
+        scene = sceneDict(
+            Scaling(V3(1, 2, 1), Sphere(V3(4, 0, 0), 1, material = 'mirror')),
+            Affine(ScalingHelper(V3(1, 1, 0.5)).toMatrix(), Sphere(V3(4, 2, 0), 1, material = 'mat'))
+        )
+        cameras = [
+            CameraPerspective(V3(0, 0, 0), V3(1, 0, 0), (1, 1), (8, 6)),
+            CameraOrthogonal(V3(0, 0, 0), V3(1, 0, 0), (5, 5), (8, 6))
+        ]
+        for camera in cameras:
+            raster = render(camera, scene)
+            with layout('packed'), precision(np.float32):
+                ray = camera.rays()
+                self.assertEqual((ray.r.data.dtype, ray.v.data.dtype), (np.float32, np.float32))
+                raster32 = render(camera, scene)
+            self.assertIsInstance(raster32, PackedV3)
+            self.assertEqual(raster32.data.dtype, np.float32)
+            self.assertLess(np.abs(raster32.data - np.stack([raster.x, raster.y, raster.z], axis = 1)).max(), 1e-3)
+    
+    def test_tiles(self):
+        resolution = (7, 5)
+        origin = V3(0, 0, 0)
+        direction = V3(1, 0, 0)
+        
+        cameras = [
+            CameraOrthogonal(origin, direction, (5, 5), resolution),
+            CameraPerspective(origin, direction, (1, 1), resolution),
+            CameraPanoramic(origin, -45, 45, -30, 30, resolution)
+        ]
+        
+        scene = sceneDict(
+            Sphere(V3(4, 0, 0), 1, material = 'mirror'),
+            Sphere(V3(-4, 0, 0), 1, material = 'mat')
+        )
+        
+        for camera in cameras:
+            raster = render(camera, scene)
+            for tile_size in [1, 2, (3, 2), 100]:
+                self.assertAllEqual(render(camera, scene, tile_size = tile_size), raster)
+
+    def test_workers(self):
+        resolution = (7, 5)
+        camera = CameraPerspective(V3(0, 0, 0), V3(1, 0, 0), (1, 1), resolution)
+        
+        scene = sceneDict(Sphere(V3(4, 0, 0), 1, material = 'mirror'))
+        
+        raster = render(camera, scene)
+        self.assertAllEqual(render(camera, scene, tile_size = 2, workers = 2), raster)
+    
+    def test_workers_spawn(self):
+        # spawned workers start from the default settings and get the
+        # layout, precision and kernel backend of the parent
+        resolution = (7, 5)
+        camera = CameraPerspective(V3(0, 0, 0), V3(1, 0, 0), (1, 1), resolution)
+        
+        scene = compileScene(sceneDict(Sphere(V3(4, 0, 0), 1, material = 'mirror')))
+        
+        class TileSink:
+            def __init__(self):
+                self.tiles = []
+            def write(self, window, tile):
+                self.tiles.append((window, tile))
+        
+        context = multiprocessing.get_context('spawn')
+        sink = TileSink()
+        with layout('packed'), precision(np.float32):
+            raster = render(camera, scene)
+            renderParallel(camera, scene, 4, 2, 2, sink = sink, context = context)
+        self.assertEqual(len(sink.tiles), 12)
+        for window, tile in sink.tiles:
+            self.assertIsInstance(tile, PackedV3)
+            self.assertEqual(tile.x.dtype, np.float32)
+            self.assertAllEqual(tile, raster.take(windowPixels(resolution, window)))
+    
+    def test_progressive(self):
+        resolution = (10, 7)
+        camera = CameraPerspective(V3(0, 0, 0), V3(1, 0, 0), (1, 1), resolution)
+        
+        scene = sceneDict(Sphere(V3(4, 0, 0), 1, material = 'mirror'))
+        
+        raster = render(camera, scene)
+        frames = list(renderProgressive(camera, scene, steps = (4, 2, 2, 1)))
+        self.assertEqual(len(frames), 4)
+        self.assertAllEqual(frames[-1], raster)
+        
+        # the first frame repeats the samples at the corners of 4x4 cells
+        first = frames[0].x.reshape(7, 10)
+        self.assertAllEqual(first, raster.x.reshape(7, 10)[::4, ::4].repeat(4, 0).repeat(4, 1)[:7, :10])
+
+    def test_adaptive(self):
+        resolution = (12, 9)
+        camera = CameraPerspective(V3(0, 0, 0), V3(1, 0, 0), (1, 1), resolution)
+        
+        scene = {
+            'objects': [
+                Sphere(V3(4, 0, 0), 1, material = 'mat')
+            ],
+            'materials': {
+                'mat': UniformMaterial(V3(1.0, 0.5, 0.25))
+            },
+            'lighting': [
+                AmbientLight(1.0)
+            ]
+        }
+        
+        raster = render(camera, scene)
+        adaptive, report = renderAdaptive(camera, scene, samples = 3)
+        uniform, everywhere = renderAdaptive(camera, scene, samples = 3, threshold = -1)
+        self.assertEqual(everywhere['edges'], 108)
+        self.assertEqual(report['uniform'], 108 * 9)
+        self.assertEqual(report['rays'], 108 + report['edges'] * 9)
+        
+        # only pixels on the outline of the sphere are supersampled
+        collisions = collide(108, camera.rays(), scene)
+        edges = edgePixels(resolution, raster, collisions.t, collisions.matid)
+        self.assertEqual(len(edges), report['edges'])
+        self.assertTrue(0 < len(edges) < 108)
+        expected = raster.x.copy()
+        expected[edges] = uniform.x[edges]
+        self.assertAllEqual(adaptive.x, expected)
+        self.assertRaises(ValueError, renderAdaptive, CameraPrecomputed(camera.rays()), scene)
+
+    def test_stats(self):
+        resolution = (10, 7)
+        camera = CameraPerspective(V3(0, 0, 0), V3(1, 0, 0), (1, 1), resolution)
+        
+        scene = sceneDict(
+            Union(
+                Sphere(V3(4, 0, 0), 1, material = 'mirror'),
+                Sphere(V3(4, 2, 0), 1, material = 'mat')
+            )
+        )
+        
+        raster = render(camera, scene)
+        stats = RenderStats(memory = True)
+        self.assertAllEqual(render(camera, scene, stats = stats), raster)
+        self.assertIsNone(activeStats())
+        
+        stages = stats.stages
+        self.assertEqual(stages['camera'].rays, 70)
+        self.assertEqual(stages['bounce 0'].rays, 70)
+        bounces = [stages[key] for key in stages if key.startswith('bounce')]
+        self.assertEqual(stages['collide'].calls, len(bounces))
+        self.assertEqual(stages['collide'].rays, sum(record.rays for record in bounces))
+        self.assertEqual(stages['shadows'].rays, stages['collide'].hits)
+        self.assertEqual(stages['shading'].rays, stages['collide'].hits)
+        self.assertTrue(stages['primitive'].rays > 0)
+        
+        # bytes are the most a stage had allocated at once
+        for record in stages.values():
+            self.assertTrue(record.bytes >= 0)
+        self.assertTrue(stages['lighting'].bytes > 0)
+        self.assertTrue(stages['reflection'].bytes > 0)
+        
+        # nodes are named by their position in the traced scene
+        union = [record for key, record in stats.nodes.items() if key.endswith('Union')]
+        self.assertEqual(len(union), 1)
+        self.assertTrue(0 < union[0].hits <= union[0].rays)
+        self.assertEqual(len(stats.nodes), 4)
+        
+        # tiles rendered by workers send their stats back to be merged
+        merged = RenderStats()
+        self.assertAllEqual(render(camera, scene, tile_size = 4, workers = 2, stats = merged), raster)
+        for key in ['camera', 'collide', 'primitive', 'shadows']:
+            self.assertEqual(merged.stages[key].rays, stages[key].rays)
+            self.assertEqual(merged.stages[key].hits, stages[key].hits)
+        self.assertEqual(sorted(merged.nodes), sorted(stats.nodes))
+
+    def test_animation(self):
+        resolution = (16, 12)
+        camera = CameraPerspective(V3(0, 0, 1), V3(1, 0, -0.2), (1, 1), resolution)
+        
+        mover = Translation(V3(0, 0, 0), Sphere(V3(4, -1, 0), 0.5, material = 'mat'))
+        scene = sceneDict(mover, Sphere(V3(5, 1.5, 0), 1, material = 'mirror'))
+        scene['lighting'] = [
+            AmbientLight(0.5),
+            DirectionalLight(V3(1, 0, -1), 0.3),
+            PointLight(V3(2, 0, 3), 4)
+        ]
+        
+        animation = AnimationRenderer(camera, scene)
+        self.assertAllEqual(animation.frame(), render(camera, scene))
+        self.assertEqual(animation.retraced, 192)
+        for step in range(1, 4):
+            mover.transform = TranslationHelper(V3(0, 0.4 * step, 0))
+            frame = animation.frame([mover])
+            self.assertTrue(0 < animation.retraced < 192)
+            self.assertAllEqual(frame, render(camera, Scene(scene['objects'], scene['materials'], scene['lighting'])))
+        
+        # nothing changed, nothing is traced
+        animation.frame([])
+        self.assertEqual(animation.retraced, 0)
+        self.assertRaises(ValueError, animation.frame, [Sphere(V3(0, 0, 0), 1)])
+
+    def test_sinks(self):
+        resolution = (10, 7)
+        camera = CameraPerspective(V3(0, 0, 0), V3(1, 0, 0), (1, 1), resolution)
+        
+        scene = sceneDict(Sphere(V3(4, 0, 0), 1, material = 'mat'))
+        scene['materials']['floor'] = CheckeredMaterial(UniformMaterial(V3(1, 1, 1)), UniformMaterial(V3(0, 0, 0)))
+        
+        raster = render(camera, scene)
+        image = np.stack([raster.x, raster.y, raster.z], axis = -1).reshape(7, 10, 3)
+        
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'image')
+            with NpySink(path + '.npy', resolution) as sink:
+                self.assertIs(render(camera, scene, tile_size = 4, sink = sink), sink)
+            self.assertTrue(np.array_equal(np.load(path + '.npy'), image.astype(np.float32)))
+            
+            with RawSink(path + '.rgb', resolution) as sink:
+                render(camera, scene, tile_size = 3, workers = 2, sink = sink)
+            raw = np.fromfile(path + '.rgb', dtype = np.uint8).reshape(7, 10, 3)
+            self.assertTrue(np.array_equal(raw, (image * 255).astype(np.uint8)))
+            
+            with PngSink(path + '.png', resolution) as sink:
+                render(camera, scene, tile_size = (4, 3), sink = sink)
+            with open(path + '.png', 'rb') as f:
+                data = f.read()
+            
+            # workers hand their tiles to the sink in order
+            with PngSink(path + '.png', resolution) as sink:
+                render(camera, scene, tile_size = (4, 3), workers = 2, sink = sink)
+            with open(path + '.png', 'rb') as f:
+                self.assertEqual(f.read(), data)
+            self.assertEqual(data[:8], b'\x89PNG\r\n\x1a\n')
+            
+            # the image data is the rows behind a filter byte each
+            chunks = []
+            offset = 8
+            while offset < len(data):
+                length, tag = struct.unpack('>I4s', data[offset:offset + 8])
+                chunks.append((tag, data[offset + 8:offset + 8 + length]))
+                offset += 12 + length
+            self.assertEqual(chunks[-1][0], b'IEND')
+            rows = zlib.decompress(b''.join(chunk for tag, chunk in chunks if tag == b'IDAT'))
+            rows = np.frombuffer(rows, dtype = np.uint8).reshape(7, 31)
+            self.assertTrue((rows[:, 0] == 0).all())
+            self.assertTrue(np.array_equal(rows[:, 1:].reshape(7, 10, 3), raw))
+            
+            sink = PngSink(path + '.png', resolution)
+            self.assertRaises(ValueError, sink.write, (0, 4, 4, 7), raster.take(np.arange(12)))
+            self.assertRaises(ValueError, sink.close)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,139 @@
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+from raytrace import *
+import unittest
+
+
+def sceneDict():
+    return {
+        'objects': [
+            Difference(
+                Sphere(V3(4, 0, 0), 1, material = 'blue'),
+                Sphere(V3(3.5, 0, 0), 0.5)
+            ),
+            Rotation(2, 0.3, Scaling(V3(1, 2, 1), Sphere(V3(4, 2, 0), 0.5, material = 'blue'))),
+            Ground(V3(0, 0, -1), V3(0, 0, 1), material = 'checkered')
+        ],
+        'materials': {
+            'blue': UniformMaterial(V3(0, 0, 1)),
+            'checkered': CheckeredMaterial(
+                UniformMaterial(V3(0.8, 0.8, 0.8)),
+                UniformMaterial(V3(0, 0, 0))
+            )
+        },
+        'lighting': [
+            AmbientLight(0.2),
+            DirectionalLight(V3(1, 1, -1))
+        ]
+    }
+
+
+class TestScene(unittest.TestCase):
+    
+    def setUp(self):
+        origin = V3(0, -1, 0.5)
+        self.camera = CameraPerspective(origin, (V3(4, 0, 0) - origin).unit(), (1, 1), (16, 16))
+    
+    def test_render(self):
+        scene = sceneDict()
+        compiled = Scene(scene['objects'], scene['materials'], scene['lighting'])
+        self.assertTrue(render(self.camera, scene).allEqual(render(self.camera, compiled)))
+        self.assertIs(compiled['objects'], compiled.objects)
+    
+    def test_cache(self):
+        scene = sceneDict()
+        compiled = compileScene(scene)
+        self.assertIs(compileScene(compiled), compiled)
+        self.assertIsNot(compileScene(scene), compiled)
+        self.assertNotIn('compiled', scene)
+        
+        # dictionaries are compiled on every render, objects changed in place
+        # between renders are seen by the next one
+        sphere = Sphere(V3(4, 0, 0), 1, material = 'blue')
+        scene = {'objects': [sphere], 'materials': sceneDict()['materials'], 'lighting': [AmbientLight(1.0)]}
+        before = render(self.camera, scene)
+        sphere.center = V3(4, 0, 1.2)
+        moved = render(self.camera, scene)
+        self.assertFalse(moved.allEqual(before))
+        self.assertTrue(moved.allEqual(render(self.camera, Scene([Sphere(V3(4, 0, 1.2), 1, material = 'blue')], scene['materials'], scene['lighting']))))
+    
+    def test_update(self):
+        sphere = Sphere(V3(4, 0, 0), 1, material = 'blue')
+        scene = Scene([sphere], sceneDict()['materials'], [AmbientLight(1.0)])
+        before = render(self.camera, scene)
+        
+        # moving an object in place takes effect once the scene is updated
+        sphere.center = V3(4, 5, 0)
+        scene.update()
+        self.assertTrue(scene.traced[0].bounds().lo.allEqual(V3(3, 4, -1)))
+        self.assertFalse(render(self.camera, scene).allEqual(before))
+    
+    def test_validation(self):
+        self.assertRaises(ValueError, Scene, ['sphere'])
+        self.assertRaises(ValueError, Scene, [], {'m': V3(1, 0, 0)})
+        self.assertRaises(ValueError, Scene, [], {}, [V3(1, 1, 1)])
+
+    def test_deep(self):
+        # generated trees far deeper than the recursion limit are merged into
+        # n-ary nodes when the scene is compiled
+        n = sys.getrecursionlimit() * 2
+        union = Sphere(V3(8, 0, 0), 0.1)
+        difference = Sphere(V3(4, 0, 0), 1)
+        for i in range(n):
+            union = Union(union, Sphere(V3(8, np.cos(i), np.sin(i)), 0.1))
+            difference = Difference(difference, Sphere(V3(3, np.cos(i), np.sin(i)), 0.1))
+        
+        scene = Scene([union, difference])
+        self.assertEqual([len(obj.children()) for obj in scene.traced], [n + 1, n + 1])
+        ray = Ray(
+            V3(np.array([0, 8]), np.array([0, 0]), np.array([0, 0.5])),
+            V3(np.array([1, 0]), np.array([0, 0]), np.array([0, -1]))
+        )
+        self.assertTrue(np.allclose(collide(2, ray, scene).t, [3, 0.4]))
+    
+    def test_shared(self):
+        # a subtree shared by both members of every union is walked once per
+        # scene, not once per path to it
+        obj = Sphere(V3(4, 0, 0), 1, material = 'blue')
+        for i in range(40):
+            obj = Union(obj, obj)
+        
+        scene = Scene([obj], sceneDict()['materials'], optimize = False)
+        sphere = [node for node in postorder(scene.traced[0]) if isinstance(node, Sphere)]
+        self.assertEqual(len(sphere), 1)
+        self.assertEqual(sphere[0].matid, scene.materialtable.id('blue'))
+    
+    def test_deep_transformations(self):
+        # CSG nodes alternating with transformations are traced as one n-ary
+        # node of transformed members
+        obj = Sphere(V3(0, 0, 0), 1, material = 'blue')
+        for i in range(400):
+            obj = Union(Translation(V3(0.01, 0, 0), obj), Sphere(V3(0, 0, 0), 1))
+        
+        scene = Scene([obj], sceneDict()['materials'])
+        self.assertEqual(len(scene.traced[0].children()), 401)
+        ray = Ray(V3(np.array([-10, 10]), np.array([0, 0]), np.array([0, 0])), V3(np.array([1, -1]), np.array([0, 0]), np.array([0, 0])))
+        collisions = collide(2, ray, scene)
+        self.assertTrue(np.allclose(collisions.t, [9, 5]))
+        self.assertEqual(list(collisions.matid), [0, scene.materialtable.id('blue')])
+        render(self.camera, scene)
+        
+        n = sys.getrecursionlimit()
+        intersection = Sphere(V3(4, 0, 0), 2)
+        difference = Sphere(V3(4, 0, 0), 2)
+        for i in range(n):
+            intersection = Rotation(0, 0.01, Intersection(intersection, Sphere(V3(4, 0, 0), 2.1 + 0.001 * i)))
+            difference = Translation(V3(0, 0, 0.0001), Difference(difference, Sphere(V3(4, 1.5, 0.001 * i), 0.3)))
+        
+        scene = Scene([intersection, difference])
+        self.assertEqual([len(obj.children()) for obj in scene.traced], [n + 1, n + 1])
+        ray = Ray(V3(np.array([0, 0]), np.array([0, 0]), np.array([0, -10])), V3(np.array([1, 0]), np.array([0, 0]), np.array([0, 1])))
+        self.assertTrue(np.allclose(collide(2, ray, Scene([intersection])).t, [2, np.inf]))
+        self.assertTrue(np.allclose(collide(2, ray, Scene([difference])).t, [4 - np.sqrt(4 - 0.1 ** 2), np.inf]))
+
+
+if __name__ == '__main__':
+    unittest.main()
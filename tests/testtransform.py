@@ -93,4 +93,48 @@ class TestRotationHelper(unittest.TestCase):
             n = int((np.random.rand(1) * 10) // 1 + 1)
             rot = RotationHelper(axis, np.pi / n)
             self.assertAllTrue(ntimes(2*n, lambda x: rot.apply(x), v) == v)
-            self.assertAllTrue(ntimes(2*n, lambda x: rot.inverse().apply(x), v) == v)
\ No newline at end of file
+            self.assertAllTrue(ntimes(2*n, lambda x: rot.inverse().apply(x), v) == v)
+
+
+class TestAffineTransform(unittest.TestCase):
+    
+    def setUp(self):
+        self.points = V3(
+            np.array([1.0, -2.0, 0.5]),
+            np.array([0.0, 3.0, -1.0]),
+            np.array([2.0, 1.0, 4.0])
+        )
+    
+    def assertClose(self, a, b):
+        self.assertTrue(np.allclose([a.x, a.y, a.z], [b.x, b.y, b.z]))
+    
+    def test_helpers(self):
+        helpers = [
+            TranslationHelper(V3(-1, 1, 2.5)),
+            ScalingHelper(V3(-1, 1, 2)),
+            RotationHelper(0, 0.3),
+            RotationHelper(1, 0.3),
+            RotationHelper(2, 0.3)
+        ]
+        for helper in helpers:
+            affine = AffineTransform(helper.toMatrix())
+            self.assertClose(affine.apply(self.points), helper.apply(self.points))
+            self.assertClose(affine.applyToDifference(self.points), helper.applyToDifference(self.points))
+            normals = self.points.unit()
+            self.assertClose(affine.applyToNormal(normals), helper.applyToNormal(normals))
+            self.assertClose(affine.inverse().apply(affine.apply(self.points)), self.points)
+    
+    def test_then(self):
+        scaling = ScalingHelper(V3(2, 1, 0.5))
+        rotation = RotationHelper(2, 0.7)
+        combined = AffineTransform(scaling.toMatrix()).then(rotation)
+        self.assertClose(combined.apply(self.points), rotation.apply(scaling.apply(self.points)))
+    
+    def test_axisRotation(self):
+        for axis, direction in enumerate([V3(1, 0, 0), V3(0, 2, 0), V3(0, 0, 1)]):
+            self.assertClose(
+                axisRotation(direction, 0.4).apply(self.points),
+                RotationHelper(axis, 0.4).apply(self.points)
+            )
+        rotation = axisRotation(V3(1, 1, 1), 2 * np.pi / 3)
+        self.assertClose(rotation.apply(V3(1, 0, 0)), V3(0, 1, 0))
\ No newline at end of file
@@ -2,11 +2,18 @@ import os
 import sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+import copy
+import pickle
 import numpy as np
 from raytrace import *
 import unittest
 
 
+def _planar(x, y, z):
+    with layout('planar'):
+        return V3(x, y, z)
+
+
 class TestV3(unittest.TestCase):
     
     #TODO: use in all places
@@ -24,6 +31,65 @@ class TestV3(unittest.TestCase):
             np.array([[1]])
         )
     
+    def test_precision(self):
+        with precision(np.float32):
+            a = V3(1, 2, 3)
+            self.assertEqual(a.x.dtype, np.float32)
+            self.assertEqual((a + a).unit().y.dtype, np.float32)
+        self.assertEqual(V3(1, 2, 3).x.dtype, np.float64)
+        self.assertEqual(V3(1, 2, 3, dtype = np.float32).z.dtype, np.float32)
+    
+    def test_inplace(self):
+        a = V3(np.array([1.0, 2.0]), np.array([2.0, 0.0]), np.array([3.0, 1.0]))
+        b = V3(-1, 1, -1)
+        c = a
+        c += b
+        c *= 2
+        c -= V3(1, 1, 1)
+        c /= np.array([1.0, 2.0])
+        self.assertIs(c, a)
+        self.assertTrue(a.allEqual(V3(np.array([-1.0, 0.5]), np.array([5.0, 0.5]), np.array([3.0, -0.5]))))
+        
+        out = V3(0, 0, 0).repeat(2)
+        self.assertIs(a.cross(b, out = out), out)
+        self.assertTrue(out.allEqual(a.cross(b)))
+        self.assertTrue(a.cross(b, out = a).allEqual(out))
+        dots = np.zeros(2)
+        self.assertIs(a.dot(b, out = dots), dots)
+        self.assertTrue((dots == a.dot(b)).all())
+        self.assertTrue(a.scale(3, out = out).allEqual(a.scale(3)))
+        self.assertTrue(np.allclose(a.unit(out = a).norm(), 1))
+    
+    def test_layout(self):
+        rng = np.random.default_rng(0)
+        data = rng.normal(size = (2, 3, 20))
+        mask = rng.random(20) < 0.5
+        a, b = V3(*data[0]), V3(*data[1])
+        with layout('packed'):
+            pa, pb = V3(*data[0]), V3(*data[1])
+            self.assertIsInstance(pa, PackedV3)
+            self.assertTrue((pa + pb).allEqual(a + b))
+            self.assertTrue(np.allclose(pa.dot(pb), a.dot(b)))
+            self.assertTrue(np.allclose(pa.dot(V3(1, 2, 3)), a.dot(V3(1, 2, 3))))
+            self.assertTrue(pa.cross(pb).allEqual(a.cross(b)))
+            self.assertTrue(pa.extract(mask).allEqual(a.extract(mask)))
+            self.assertTrue(pa.where(mask, pb).allEqual(a.where(mask, b)))
+            pa.place(mask, pb.extract(mask))
+            pa.x[0] = 7
+            self.assertEqual(pa.data[0, 0], 7)
+        a.place(mask, b.extract(mask))
+        a.x[0] = 7
+        self.assertTrue(pa.allEqual(a))
+        self.assertNotIsInstance(V3(1, 2, 3), PackedV3)
+    
+    def test_pickle(self):
+        for name in ('planar', 'packed'):
+            with layout(name):
+                for a in (V3(1, 2, 3), PackedV3(1, 2, 3), _planar(1, 2, 3)):
+                    for b in (pickle.loads(pickle.dumps(a)), copy.copy(a), copy.deepcopy(a)):
+                        self.assertIs(type(b), type(a))
+                        self.assertTrue(b.allEqual(a))
+    
     def test_unvectorized(self):
         a = V3(1, 2, 3)
         b = V3(-1, 1, -1)